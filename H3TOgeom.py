@@ -4,8 +4,9 @@ Convert H3 res8 IDs to Polygon geometry and write a GeoParquet (no compression).
 
 - Input:  Parquet file (or dataset directory) with a column like 'h3_res8_id'
 - Output: GeoParquet file with:
-    - 'geometry' column (WKB Polygon, EPSG:4326)
-    - proper GeoParquet metadata
+    - 'geometry' column (WKB Polygon, or native GeoArrow polygon with --encoding geoarrow; EPSG:4326)
+    - 'bbox' struct column (GeoParquet 1.1 covering) so readers can prune row groups by extent
+    - proper GeoParquet 1.1 metadata, including the file bbox
     - no compression
 
 Usage:
@@ -14,17 +15,29 @@ Usage:
       --output /path/to/output.geoparquet \
       --h3-col h3_res8_id \
       --geom-col geometry \
-      --batch-size 100000
+      --batch-size 100000 \
+      --cache-size 1000000 \
+      --workers 8 \
+      --encoding geoarrow      # or: --benchmark to compare wkb vs geoarrow
 """
 
 import argparse
+import json
+import os
 import sys
-from typing import Optional, List
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
 
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
 import pyarrow.parquet as pq
 
+import shapely
 from shapely.geometry import Polygon
 from shapely.wkb import dumps as wkb_dumps
 import h3  # python-h3
@@ -35,9 +48,8 @@ def h3_to_wkb(h3_index: Optional[str]) -> Optional[bytes]:
     if not h3_index:
         return None
     try:
-        # geo_json=True returns [(lat, lon), ...] in CCW order on a sphere
-        boundary_latlon = h3.h3_to_geo_boundary(h3_index, geo_json=True)
-        ring = [(lon, lat) for (lat, lon) in boundary_latlon]  # shapely expects (x=lon, y=lat)
+        # geo_json=True already returns a closed [(lon, lat), ...] ring, CCW on a sphere
+        ring = h3.h3_to_geo_boundary(h3_index, geo_json=True)
         poly = Polygon(ring)
         if not poly.is_valid:
             poly = poly.buffer(0)
@@ -48,31 +60,171 @@ def h3_to_wkb(h3_index: Optional[str]) -> Optional[bytes]:
         return None
 
 
-def build_geo_metadata(geom_col: str) -> dict:
+def h3_to_ring(h3_index: Optional[str]) -> Optional[tuple]:
+    """Closed (lon, lat) boundary ring of a single H3 index, no Shapely involved."""
+    if not h3_index:
+        return None
+    try:
+        return tuple(h3.h3_to_geo_boundary(h3_index, geo_json=True))
+    except Exception:
+        return None
+
+
+# GeoParquet native "polygon" encoding: list<rings: list<vertices: struct<x, y>>> (separated coords)
+POINT_TYPE = pa.struct([pa.field("x", pa.float64(), nullable=False), pa.field("y", pa.float64(), nullable=False)])
+RING_TYPE = pa.list_(pa.field("vertices", POINT_TYPE, nullable=False))
+POLYGON_TYPE = pa.list_(pa.field("rings", RING_TYPE, nullable=False))
+
+CELL_ENCODERS = {"wkb": h3_to_wkb, "geoarrow": h3_to_ring}
+GEOPARQUET_ENCODINGS = {"wkb": "WKB", "geoarrow": "polygon"}
+
+
+# GeoParquet 1.1 bbox covering column
+BBOX_COLUMN = "bbox"
+BBOX_TYPE = pa.struct([(name, pa.float64()) for name in ("xmin", "ymin", "xmax", "ymax")])
+
+
+def geometry_type(encoding: str) -> pa.DataType:
+    return pa.binary() if encoding == "wkb" else POLYGON_TYPE
+
+
+def rings_to_polygons(rings: list) -> pa.Array:
+    """One closed ring per polygon → GeoArrow polygon array built from flat coordinate buffers."""
+    valid = np.array([r is not None for r in rings], dtype=bool)
+    sizes = np.array([len(r) for r in rings if r is not None], dtype=np.int32)
+    coords = np.array([xy for r in rings if r is not None for xy in r], dtype=np.float64).reshape(-1, 2)
+    vertices = pa.StructArray.from_arrays(
+        [pa.array(coords[:, 0]), pa.array(coords[:, 1])], fields=list(POINT_TYPE)
+    )
+    ring_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int32)
+    ring_array = pa.ListArray.from_arrays(pa.array(ring_offsets), vertices, type=RING_TYPE)
+    polygon_offsets = np.concatenate([[0], np.cumsum(valid)]).astype(np.int32)
+    return pa.ListArray.from_arrays(
+        pa.array(polygon_offsets), ring_array, type=POLYGON_TYPE, mask=pa.array(~valid)
+    )
+
+
+def cell_bounds(values: list, encoding: str) -> pa.Array:
+    """(xmin, ymin, xmax, ymax) per distinct cell as a bbox struct array (null where the cell is null)."""
+    if encoding == "wkb":
+        bounds = shapely.bounds(shapely.from_wkb(np.array(values, dtype=object)))
+    else:
+        bounds = np.full((len(values), 4), np.nan)
+        valid = np.array([r is not None for r in values], dtype=bool)
+        if valid.any():
+            sizes = np.array([len(r) for r in values if r is not None])
+            coords = np.array([xy for r in values if r is not None for xy in r], dtype=np.float64)
+            starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+            bounds[valid, :2] = np.minimum.reduceat(coords, starts)
+            bounds[valid, 2:] = np.maximum.reduceat(coords, starts)
+    mask = pa.array(np.isnan(bounds[:, 0]))
+    return pa.StructArray.from_arrays([pa.array(bounds[:, i]) for i in range(4)], fields=list(BBOX_TYPE), mask=mask)
+
+
+def make_cell_cache(cache_size: int, encoding: str = "wkb") -> Callable[[Optional[str]], Optional[Any]]:
+    """Bounded LRU around the per-cell encoder, shared across batches (cells repeat across the file)."""
+    return lru_cache(maxsize=cache_size)(CELL_ENCODERS[encoding])
+
+
+def h3_column_to_geometry(column: pa.ChunkedArray, cell_fn, encoding: str = "wkb") -> Tuple[pa.Array, pa.Array]:
+    """
+    Dictionary-encode the batch's H3 ids, build geometry and bbox once per distinct
+    cell and scatter them back to the rows with `take` (null ids stay null).
     """
-    GeoParquet schema-level metadata block.
+    encoded = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if not pa.types.is_dictionary(encoded.type):
+        encoded = encoded.dictionary_encode()
+    values = [cell_fn(h) for h in encoded.dictionary.to_pylist()]
+    cells = pa.array(values, type=pa.binary()) if encoding == "wkb" else rings_to_polygons(values)
+    return cells.take(encoded.indices), cell_bounds(values, encoding).take(encoded.indices)
+
+
+def convert_h3(h3_vals: pa.Array, cell_fn, encoding: str = "wkb") -> Tuple[pa.Array, pa.Array, int, int]:
+    """h3_column_to_geometry plus this call's cache hits/misses."""
+    before = cell_fn.cache_info()
+    geom_array, bbox_array = h3_column_to_geometry(h3_vals, cell_fn, encoding)
+    after = cell_fn.cache_info()
+    return geom_array, bbox_array, after.hits - before.hits, after.misses - before.misses
+
+
+_worker_cell_fn = None  # per-process cache, set by _init_worker
+_worker_encoding = "wkb"
+
+
+def _init_worker(cache_size: int, encoding: str):
+    global _worker_cell_fn, _worker_encoding
+    _worker_cell_fn = make_cell_cache(cache_size, encoding)
+    _worker_encoding = encoding
+
+
+def _convert_in_worker(h3_vals: pa.Array) -> Tuple[pa.Array, pa.Array, int, int]:
+    return convert_h3(h3_vals, _worker_cell_fn, _worker_encoding)
+
+
+def convert_batches(
+    batches: Iterable[pa.RecordBatch],
+    h3_col: str,
+    cache_size: int,
+    workers: int = 0,
+    in_flight: Optional[int] = None,
+    encoding: str = "wkb",
+) -> Iterator[Tuple[pa.RecordBatch, pa.Array, pa.Array, int, int]]:
+    """
+    Yield (batch, geometry_array, bbox_array, cache_hits, cache_misses) in input order.
+    workers > 1: only the H3 column is shipped to a process pool; at most
+    `in_flight` batches are pending, so reading stalls instead of buffering.
+    """
+    if workers <= 1:
+        cell_fn = make_cell_cache(cache_size, encoding)
+        for batch in batches:
+            yield (batch, *convert_h3(batch.column(batch.schema.get_field_index(h3_col)), cell_fn, encoding))
+        return
+
+    in_flight = in_flight or 2 * workers
+    window = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_size, encoding)) as pool:
+        try:
+            for batch in batches:
+                h3_vals = batch.column(batch.schema.get_field_index(h3_col))
+                window.append((batch, pool.submit(_convert_in_worker, h3_vals)))
+                if len(window) >= in_flight:
+                    batch, future = window.popleft()
+                    yield (batch, *future.result())
+            while window:
+                batch, future = window.popleft()
+                yield (batch, *future.result())
+        finally:
+            for _, future in window:
+                future.cancel()
+
+
+def build_geo_metadata(geom_col: str, encoding: str = "wkb", bbox: Optional[list] = None) -> dict:
+    """
+    GeoParquet 1.1 schema-level metadata block. The file bbox is only known once
+    every batch is written, so the final block is re-added when the writer closes.
     Ref: https://github.com/opengeospatial/geoparquet
     """
+    column_meta = {
+        "encoding": GEOPARQUET_ENCODINGS[encoding],
+        "geometry_types": ["Polygon"],   # H3 boundary → Polygon
+        # no "crs": the 1.1 default is OGC:CRS84 (lon/lat WGS84), i.e. EPSG:4326 in x/y order
+        "edges": "spherical",
+        "orientation": "counterclockwise",
+        "covering": {
+            "bbox": {key: [BBOX_COLUMN, key] for key in ("xmin", "ymin", "xmax", "ymax")}
+        },
+    }
+    if bbox is not None:
+        column_meta["bbox"] = bbox
     geo_meta = {
         "geo": {
-            "version": "0.4.0",
+            "version": "1.1.0",
             "primary_column": geom_col,
-            "columns": {
-                geom_col: {
-                    "encoding": "WKB",
-                    "geometry_types": ["Polygon"],   # H3 boundary → Polygon
-                    "crs": "EPSG:4326",
-                    "edges": "spherical",
-                    "orientation": "counterclockwise",
-                    # "bbox": [minx, miny, maxx, maxy]  # optional; omitted for streaming
-                }
-            }
+            "columns": {geom_col: column_meta},
         }
     }
-    # Arrow wants keys/values to be bytes
-    return {k.encode("utf-8"): pa.scalar(v).as_buffer().to_pybytes() for k, v in {
-        "geo": pa.scalar(geo_meta["geo"]).to_string()
-    }.items()}
+    # Arrow wants keys/values to be bytes; the value is the JSON document
+    return {k.encode("utf-8"): json.dumps(v).encode("utf-8") for k, v in geo_meta.items()}
 
 
 def process(
@@ -81,43 +233,64 @@ def process(
     h3_col: str,
     geom_col: str,
     batch_size: int,
+    cache_size: int = 1_000_000,
+    workers: int = 0,
+    in_flight: Optional[int] = None,
+    encoding: str = "wkb",
 ):
     dataset = ds.dataset(input_path, format="parquet")
     schema = dataset.schema
 
     if h3_col not in schema.names:
         raise ValueError(f"Input column '{h3_col}' not found. Available: {schema.names}")
+    if BBOX_COLUMN in schema.names:
+        raise ValueError(f"Input already has a '{BBOX_COLUMN}' column; it is reserved for the bbox covering")
 
-    # Prepare output schema = input + binary geometry column
+    # Prepare output schema = input + geometry column (WKB binary or GeoArrow polygon)
     out_fields = list(schema)
-    out_fields.append(pa.field(geom_col, pa.binary()))
+    out_fields.append(pa.field(geom_col, geometry_type(encoding)))
+    out_fields.append(pa.field(BBOX_COLUMN, BBOX_TYPE))
     out_schema = pa.schema(out_fields)
 
     # Attach GeoParquet metadata at the schema level
-    geo_md = build_geo_metadata(geom_col)
+    geo_md = build_geo_metadata(geom_col, encoding)
     out_schema = out_schema.with_metadata(geo_md)
 
+    # The file bbox goes into the footer at close (pyarrow >= 17). The embedded Arrow
+    # schema would keep the stale "geo" block for Arrow readers, so it is not stored then.
+    can_update_footer = hasattr(pq.ParquetWriter, "add_key_value_metadata")
+
     # Writer with NO COMPRESSION
     writer = pq.ParquetWriter(
         where=output_path,
         schema=out_schema,
         compression=None,           # ← no compression
         use_dictionary=False,       # purely optional; avoids dict encoding
-        write_statistics=True
+        write_statistics=True,
+        store_schema=not can_update_footer,
     )
 
-    total_rows = 0
+    total_rows = hits = misses = 0
+    file_bbox = [np.inf, np.inf, -np.inf, -np.inf]
+    t0 = time.time()
     try:
-        scanner = dataset.scan(batch_size=batch_size)
-        for i, batch in enumerate(scanner.to_batches()):
-            # Convert H3 → WKB geometry per batch
-            h3_vals: List[Optional[str]] = batch.column(batch.schema.get_field_index(h3_col)).to_pylist()
-            wkb_vals = [h3_to_wkb(h) for h in h3_vals]
-            wkb_array = pa.array(wkb_vals, type=pa.binary())
-
-            # Append geometry column
-            arrays = [batch.column(j) for j in range(batch.num_columns)] + [wkb_array]
-            names = list(batch.schema.names) + [geom_col]
+        converted = convert_batches(
+            dataset.to_batches(batch_size=batch_size), h3_col, cache_size, workers, in_flight, encoding
+        )
+        for i, (batch, geom_array, bbox_array, batch_hits, batch_misses) in enumerate(converted):
+            # H3 → geometry was built once per distinct cell in the batch (in order, possibly in a worker)
+            hits += batch_hits
+            misses += batch_misses
+
+            # Grow the file bbox from this batch's bounds
+            for k, (key, agg) in enumerate([("xmin", min), ("ymin", min), ("xmax", max), ("ymax", max)]):
+                value = (pc.min if agg is min else pc.max)(bbox_array.field(key)).as_py()
+                if value is not None:
+                    file_bbox[k] = agg(file_bbox[k], value)
+
+            # Append geometry + bbox covering columns
+            arrays = [batch.column(j) for j in range(batch.num_columns)] + [geom_array, bbox_array]
+            names = list(batch.schema.names) + [geom_col, BBOX_COLUMN]
             out_batch = pa.RecordBatch.from_arrays(arrays, names=names)
 
             # Write out immediately (streaming)
@@ -126,12 +299,47 @@ def process(
 
             if (i + 1) % 10 == 0:
                 print(f"[info] processed ~{total_rows:,} rows...", file=sys.stderr)
+
+        if np.isfinite(file_bbox).all():
+            if can_update_footer:
+                final_md = build_geo_metadata(geom_col, encoding, bbox=[float(v) for v in file_bbox])
+                writer.add_key_value_metadata({k.decode(): v.decode() for k, v in final_md.items()})
+            else:
+                print("[warn] pyarrow < 17 cannot update footer metadata; file bbox omitted "
+                      "(the bbox covering column is still written)", file=sys.stderr)
     finally:
         writer.close()
 
+    elapsed = time.time() - t0
+    lookups = hits + misses
     print(f"[done] wrote GeoParquet (no compression): {output_path}")
-    print(f"[rows] total rows: {total_rows:,}")
-    print(f"[geom] column: {geom_col} (WKB, EPSG:4326)")
+    print(f"[rows] total rows: {total_rows:,} ({total_rows / max(elapsed, 1e-9):,.0f} rows/s, "
+          f"{max(workers, 1)} process{'es' if workers > 1 else ''})")
+    print(
+        f"[cache] {lookups:,} distinct-per-batch lookups, {misses:,} boundaries built, "
+        f"hit rate {hits / max(lookups, 1):.1%}, "
+        f"{total_rows / max(misses, 1):,.1f}x fewer boundary builds than one per row"
+    )
+    print(f"[geom] column: {geom_col} ({GEOPARQUET_ENCODINGS[encoding]}, EPSG:4326), bbox: {file_bbox}")
+
+
+def benchmark(input_path: str, output_path: str, h3_col: str, geom_col: str, batch_size: int, **kwargs):
+    """Write the same input with each encoding and compare file size, write time and read time."""
+    stem, ext = os.path.splitext(output_path)
+    results = []
+    for encoding in GEOPARQUET_ENCODINGS:
+        path = f"{stem}.{encoding}{ext or '.parquet'}"
+        t0 = time.time()
+        process(input_path, path, h3_col, geom_col, batch_size, encoding=encoding, **kwargs)
+        write_s = time.time() - t0
+        t0 = time.time()
+        pq.read_table(path, columns=[geom_col])
+        read_s = time.time() - t0
+        results.append((encoding, os.path.getsize(path), write_s, read_s))
+
+    print(f"\n[bench] {'encoding':<10} {'size MB':>10} {'write s':>9} {'read s':>8}")
+    for encoding, size, write_s, read_s in results:
+        print(f"[bench] {encoding:<10} {size / 1e6:>10.1f} {write_s:>9.2f} {read_s:>8.2f}")
 
 
 def main():
@@ -141,14 +349,33 @@ def main():
     ap.add_argument("--h3-col", default="h3_res8_id", help="Name of the H3 index column")
     ap.add_argument("--geom-col", default="geometry", help="Name of the output geometry column")
     ap.add_argument("--batch-size", type=int, default=100_000, help="Rows per batch (tune for RAM/CPU)")
+    ap.add_argument("--cache-size", type=int, default=1_000_000, help="H3 cells kept in the geometry LRU cache")
+    ap.add_argument("--workers", type=int, default=0, help="Convert batches in N processes (0 = in this process)")
+    ap.add_argument("--in-flight", type=int, default=None, help="Max batches pending in the pool (default 2 x workers)")
+    ap.add_argument(
+        "--encoding", choices=list(GEOPARQUET_ENCODINGS), default="wkb",
+        help="wkb = WKB blobs; geoarrow = native GeoParquet polygon (nested x/y lists)",
+    )
+    ap.add_argument("--benchmark", action="store_true", help="Write both encodings and compare size/write/read time")
     args = ap.parse_args()
 
+    if args.benchmark:
+        benchmark(
+            args.input, args.output, args.h3_col, args.geom_col, args.batch_size,
+            cache_size=args.cache_size, workers=args.workers, in_flight=args.in_flight,
+        )
+        return
+
     process(
         input_path=args.input,
         output_path=args.output,
         h3_col=args.h3_col,
         geom_col=args.geom_col,
         batch_size=args.batch_size,
+        cache_size=args.cache_size,
+        workers=args.workers,
+        in_flight=args.in_flight,
+        encoding=args.encoding,
     )
 
 
@@ -1,17 +1,27 @@
+import argparse
+import json
 import os
-from typing import Optional, List
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, List
 
-import geopandas as gpd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
 import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS, Transformer
 from sqlalchemy import create_engine
 from dotenv import load_dotenv
-from shapely import wkb
 
 # ───────── LOAD ENV FILE ─────────
 load_dotenv()
 DB_URL = os.getenv("DATABASE_URL")  # Use local for testing
-if not DB_URL:
-    raise ValueError("❌ DATABASE_URL not found in .env file")
 
 # ───────── CONFIGURATION ─────────
 INPUT_FILE     = r"D:\CIR\prefect_ELT\AllStates_Combined.parquet"  # path to GeoParquet
@@ -19,6 +29,48 @@ TABLE_NAME     = "us_broadband"
 SCHEMA         = "public"
 CHUNKSIZE      = 750_000   # rows per DB insert
 BATCHSIZE      = 1_000_000   # rows read from parquet at a time
+GEOM_COLUMN    = "geom"      # geometry column name in PostGIS
+SRID           = 4326
+
+# Geometry handling: WKB is passed through untouched unless one of these needs it
+VALIDATE_GEOMETRY = False   # decode, make_valid() invalid rows, re-encode
+
+# Where point geometry comes from: "wkb" = the stored 'geometry' column,
+# "latlon" = built in bulk from the coordinate columns (the geometry column is
+# then never read and may be dropped from input files).
+GEOMETRY_SOURCE  = "wkb"
+LATITUDE_COLUMN  = "latitude"
+LONGITUDE_COLUMN = "longitude"
+
+# Pipelined upload: reader thread → transform pool → N writer connections
+TRANSFORM_WORKERS = 2       # threads decoding/normalizing batches
+UPLOAD_WORKERS    = 4       # concurrent DB writer connections
+MAX_IN_FLIGHT     = 8       # batches read but not yet committed (back-pressure)
+ORDERED_COMMIT    = True    # commit batches in parquet order (False = as soon as written)
+
+# Multi-process upload: row-group ranges → worker processes, each with its own connection
+PROCESS_WORKERS     = 0          # 0 = threaded pipeline above; N = N worker processes
+ROW_GROUPS_PER_TASK = 4          # row groups per task (one transaction per task)
+TASK_RETRIES        = 2          # extra attempts for a failed row-group range
+PARALLEL_TARGET     = "table"    # "table" = COPY into TABLE_NAME, "staging" = per-worker tables merged at the end
+
+# Load mode: "replace" = drop the table and COPY into it (indexes maintained during
+# the load); "staging" = COPY into an UNLOGGED, index-free staging table, build
+# indexes in parallel, ANALYZE, then swap it in atomically; "merge" = stage the
+# release and apply only the inserts/updates/deletes against the live table.
+LOAD_MODE           = "replace"
+MERGE_KEYS          = ["location_id", "provider_id", "technology"]  # identity of a row across releases
+INDEX_COLUMNS       = ["state_usps", "provider_id", "technology", "h3_res8_id"]  # btree indexes built after a staging load
+INDEX_WORKERS       = 4          # parallel index-build connections
+INDEX_WORK_MEM      = "1GB"      # maintenance_work_mem for index builds
+CLUSTER_ON_GEOMETRY = False      # CLUSTER the staging table on its GiST index before the swap
+STAGING_SET_LOGGED  = True       # make the staging table crash-safe (WAL-logged) before it goes live
+
+# Row filters pushed down to the parquet reader, e.g. {"state_usps": ["NY"]}.
+# Row groups whose statistics cannot match are never decoded. With filters set,
+# only the matching rows in the table are deleted and reloaded (no replace).
+FILTERS: Optional[Dict[str, Any]] = None
+FILTER_OR_MAX_VALUES = 32   # up to this many values per column become OR-ed == tests (prunable); more use isin
 
 # Only keep these columns + geometry. Set to None to keep all.
 SELECT_COLUMNS: Optional[List[str]] = [
@@ -39,89 +91,1155 @@ SELECT_COLUMNS: Optional[List[str]] = [
     "longitude"
 ]
 
-# DB engine
-engine = create_engine(DB_URL)
+# Memory-compact batches: low-cardinality strings are read as Arrow dictionaries
+# (pandas categoricals), speeds are downcast, coordinates go to float32 when the
+# precision budget allows. Set COMPACT_DTYPES = False to keep the file's types.
+COMPACT_DTYPES      = True
+DICTIONARY_COLUMNS  = ["brand_name", "technology", "state_usps", "business_residential_code", "block_geoid"]
+SPEED_COLUMNS       = ["max_advertised_download_speed", "max_advertised_upload_speed"]
+SPEED_MAX_MBPS      = 100_000    # largest speed expected; picks the smallest int type that holds it
+COORD_COLUMNS       = ["latitude", "longitude"]
+COORD_PRECISION_M   = 1.0        # allowed coordinate rounding error in metres (float32 ≈ 0.85 m worst case)
+
+# DB engine: created on first use, so scripts that configure() their own database
+# don't need DATABASE_URL
+engine = None
+
+
+def get_engine():
+    global engine
+    if engine is None:
+        if not DB_URL:
+            raise ValueError("❌ DATABASE_URL not found in .env file")
+        engine = create_engine(DB_URL)
+    return engine
+
+
+def configure(db_url: Optional[str] = None, **settings):
+    """
+    Point this loader at another table/database for a script that reuses it
+    (cdp_noncdp.py, distribution.py): override the CONFIGURATION settings above
+    and, with `db_url`, the engine.
+    """
+    global DB_URL, engine
+    unknown = [name for name in settings if not (name.isupper() and name in globals())]
+    if unknown:
+        raise ValueError(f"❌ Unknown broadband settings: {unknown}")
+    globals().update(settings)
+    if db_url:
+        DB_URL = db_url
+        engine = create_engine(db_url)
 
 
 # ───────── Helpers ─────────
-def force_epsg4326(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    """Ensure EPSG:4326 for PostGIS upload."""
-    if gdf.crs is None:
-        gdf = gdf.set_crs(epsg=4326, allow_override=True)
-    elif gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
+def read_geo_metadata(parquet_file: str, geom_col: str = "geometry") -> dict:
+    """Return the GeoParquet column metadata for `geom_col` ({} if the file has none)."""
+    metadata = pq.read_schema(parquet_file).metadata or {}
+    if b"geo" not in metadata:
+        return {}
+    geo = json.loads(metadata[b"geo"])
+    return geo.get("columns", {}).get(geom_col, {})
+
+
+def needs_reprojection(crs) -> bool:
+    """GeoParquet CRS → True unless it is (or defaults to) lon/lat WGS84."""
+    if crs is None:
+        return False  # spec default is OGC:CRS84
+    crs = CRS.from_user_input(crs)
+    return not (crs.to_epsg() == SRID or crs.equals("OGC:CRS84", ignore_axis_order=True))
+
+
+def force_epsg4326(wkb_values: pa.Array, crs) -> pa.Array:
+    """Reproject a WKB array to EPSG:4326 (vectorized, one decode/encode per row)."""
+    transformer = Transformer.from_crs(CRS.from_user_input(crs), SRID, always_xy=True)
+    geoms = shapely.from_wkb(wkb_values.to_numpy(zero_copy_only=False))
+    geoms = shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+    return pa.array(shapely.to_wkb(geoms), type=pa.binary())
+
+
+def make_valid_wkb(wkb_values: pa.Array) -> pa.Array:
+    """Repair invalid geometries; valid rows keep their original WKB bytes."""
+    geoms = shapely.from_wkb(wkb_values.to_numpy(zero_copy_only=False))
+    invalid = ~shapely.is_valid(geoms) & ~shapely.is_missing(geoms)
+    if not invalid.any():
+        return wkb_values
+    out = wkb_values.to_numpy(zero_copy_only=False).copy()
+    out[invalid] = shapely.to_wkb(shapely.make_valid(geoms[invalid]))
+    return pa.array(out, type=pa.binary())
+
+
+def geometry_source_columns() -> List[str]:
+    """Parquet columns the geometry is built from."""
+    if GEOMETRY_SOURCE == "latlon":
+        return [LATITUDE_COLUMN, LONGITUDE_COLUMN]
+    if GEOMETRY_SOURCE == "wkb":
+        return ["geometry"]
+    raise ValueError(f"❌ GEOMETRY_SOURCE must be 'wkb' or 'latlon', got {GEOMETRY_SOURCE!r}")
+
+
+def apply_select_columns(names: List[str], selects: Optional[List[str]]) -> List[str]:
+    """Columns to project from the parquet file."""
+    keep = [c for c in selects if c in names] if selects else list(names)
+    if GEOMETRY_SOURCE == "latlon" and "geometry" in keep:
+        keep.remove("geometry")  # never decode the stored WKB
+    # Always keep the geometry source columns
+    for col in geometry_source_columns():
+        if col not in keep:
+            keep.append(col)
+    return keep
+
+
+def load_schema(dataset: ds.Dataset) -> pa.Schema:
+    """Schema of transformed batches, and therefore of the PostGIS table."""
+    fields = [dataset.schema.field(c) for c in apply_select_columns(dataset.schema.names, SELECT_COLUMNS)]
+    if GEOMETRY_SOURCE == "latlon":
+        fields.append(pa.field("geometry", pa.binary()))
+    return compact_schema(pa.schema(fields))
+
+
+def load_geo_metadata(parquet_file: str) -> dict:
+    """GeoParquet metadata for the geometry being loaded (synthesized for latlon points)."""
+    if GEOMETRY_SOURCE == "latlon":
+        return {"encoding": "WKB", "geometry_types": ["Point"]}
+    geo_meta = read_geo_metadata(parquet_file)
+    if geo_meta.get("encoding", "WKB").upper() != "WKB":
+        raise ValueError(f"❌ Unsupported GeoParquet geometry encoding: {geo_meta['encoding']}")
+    return geo_meta
+
+
+def build_filter(filters: Optional[Dict[str, Any]], schema: pa.Schema) -> Optional[ds.Expression]:
+    """{"col": value | [values]} → dataset expression, values cast to the column type."""
+    expr = None
+    for col, value in (filters or {}).items():
+        if col not in schema.names:
+            raise ValueError(f"❌ Filter column '{col}' not found. Available: {schema.names}")
+        col_type = schema.field(col).type
+        if pa.types.is_dictionary(col_type):
+            # Row-group statistics are not used for dictionary-typed reads: every row group would be scanned
+            print(f"⚠️ Filter column '{col}' is read as a dictionary; its row groups cannot be pruned")
+            col_type = col_type.value_type
+        values = pa.array(list(value) if isinstance(value, (list, tuple, set)) else [value]).cast(col_type)
+        if len(values) <= FILTER_OR_MAX_VALUES:
+            # == (OR-ed for a few values) is checked against row-group min/max; isin is not
+            cond = None
+            for v in values:
+                term = ds.field(col) == v
+                cond = term if cond is None else cond | term
+        else:
+            cond = ds.field(col).isin(values)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def filter_sql(filters: Optional[Dict[str, Any]], schema: pa.Schema):
+    """Same filters as a SQL WHERE clause + params, for deleting rows before a reload."""
+    clauses, params = [], []
+    for col, value in (filters or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        clauses.append(f"{quote_ident(col)} = ANY(%s)")
+        col_type = schema.field(col).type
+        if pa.types.is_dictionary(col_type):
+            col_type = col_type.value_type
+        params.append(pa.array(list(values)).cast(col_type).to_pylist())
+    return " AND ".join(clauses), params
+
+
+def parquet_format(filters: Optional[Dict[str, Any]] = None) -> ds.ParquetFileFormat:
+    """
+    Parquet reader settings; dictionary columns are decoded straight to Arrow
+    dictionaries. Filter columns are left plain: a dictionary-typed column is not
+    matched against row-group statistics, so nothing would be pruned.
+    compact_batch() dictionary-encodes them after the scan.
+    """
+    dictionary_columns = [c for c in DICTIONARY_COLUMNS if c not in (filters or {})] if COMPACT_DTYPES else []
+    return ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=dictionary_columns))
+
+
+def _smallest_int_type(max_value: int) -> pa.DataType:
+    for int_type, limit in ((pa.int16(), 2**15 - 1), (pa.int32(), 2**31 - 1)):
+        if max_value <= limit:
+            return int_type
+    return pa.int64()
+
+
+def _float32_error_m() -> float:
+    """Worst-case float32 rounding error for a lon/lat value, in metres."""
+    return float(np.spacing(np.float32(180.0))) / 2 * 111_320
+
+
+def compact_schema(schema: pa.Schema) -> pa.Schema:
+    """
+    Target types for a batch, derived from the schema alone so every batch (and
+    the PostGIS table) gets the same types. Dictionary columns already arrive as
+    dictionaries from parquet_format().
+    """
+    if not COMPACT_DTYPES:
+        return schema
+    coord_type = pa.float32() if _float32_error_m() <= COORD_PRECISION_M else pa.float64()
+    fields = []
+    for field in schema:
+        if field.name in SPEED_COLUMNS and pa.types.is_integer(field.type):
+            field = field.with_type(_smallest_int_type(SPEED_MAX_MBPS))
+        elif field.name == "location_id":
+            field = field.with_type(pa.int64())
+        elif field.name in COORD_COLUMNS and pa.types.is_floating(field.type):
+            field = field.with_type(coord_type)
+        elif field.name in DICTIONARY_COLUMNS and not pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def compact_batch(table: pa.Table) -> pa.Table:
+    """Cast a batch to compact_schema(); overflowing speeds raise instead of wrapping."""
+    target = compact_schema(table.schema)
+    for i, (field, new) in enumerate(zip(table.schema, target)):
+        if field.type == new.type:
+            continue
+        if pa.types.is_dictionary(new.type):
+            column = pc.dictionary_encode(table.column(i))  # non-string columns aren't read as dictionaries
+        else:
+            column = table.column(i).cast(new.type)
+        table = table.set_column(i, new.name, column)
+    return table
+
+
+def open_parquet_dataset(parquet_file: str, filters: Optional[Dict[str, Any]] = None) -> ds.Dataset:
+    dataset = ds.dataset(parquet_file, format=parquet_format(filters))
+    for col in geometry_source_columns():
+        if col not in dataset.schema.names:
+            raise ValueError(f"❌ No '{col}' column found in parquet file")
+    return dataset
 
 
-def apply_select_columns(gdf: gpd.GeoDataFrame, selects: Optional[List[str]]) -> gpd.GeoDataFrame:
-    if not selects:
-        return gdf
-    keep = [c for c in selects if c in gdf.columns]
-    # Always keep geometry
-    if gdf.geometry.name not in keep:
-        keep.append(gdf.geometry.name)
-    return gdf[keep]
+def stream_parquet_batches(parquet_file: str, batch_size: int, filters: Optional[Dict[str, Any]] = None):
+    """
+    Yield Arrow tables in batches directly from a big parquet file; geometry stays WKB.
+    Only SELECT_COLUMNS + geometry source columns are read, and row groups are pruned with
+    `filters` against their min/max statistics before anything is decoded.
+    """
+    dataset = open_parquet_dataset(parquet_file, filters)
+    columns = apply_select_columns(dataset.schema.names, SELECT_COLUMNS)
+    expr = build_filter(filters, dataset.schema)
 
+    total_groups = kept_groups = 0
+    for fragment in dataset.get_fragments():
+        total_groups += fragment.num_row_groups
+        row_groups = fragment.split_by_row_group(expr) if expr is not None else [fragment]
+        kept_groups += sum(rg.num_row_groups for rg in row_groups)
+        for rg in row_groups:
+            for batch in rg.to_batches(schema=dataset.schema, columns=columns, filter=expr, batch_size=batch_size):
+                yield pa.Table.from_batches([batch])
+    if expr is not None:
+        print(f"🔎 Scanned {kept_groups}/{total_groups} row groups matching {filters}")
 
-from shapely import wkb
 
-def stream_parquet_batches(parquet_file: str, batch_size: int):
-    """Yield GeoDataFrames in batches directly from a big parquet file."""
-    pf = pq.ParquetFile(parquet_file)
-    for batch in pf.iter_batches(batch_size=batch_size):
-        df = batch.to_pandas()
+# ───────── PostGIS COPY ─────────
+_HEX_DIGITS = np.array([f"{i:02x}".encode() for i in range(256)], dtype="S2")
 
-        # Detect geometry column automatically
-        if "geometry" not in df.columns:
-            raise ValueError("❌ No 'geometry' column found in parquet file")
 
-        # Decode WKB → Shapely
-        df["geom"] = df["geometry"].apply(lambda x: wkb.loads(x) if isinstance(x, (bytes, bytearray)) else x)
-        df = df.drop(columns=["geometry"])  # drop old WKB column
+def hex_encode(values: pa.Array) -> pa.Array:
+    """Hex-encode a binary array without touching rows in Python."""
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    values = values.cast(pa.large_binary())
+    offsets = np.frombuffer(values.buffers()[1], dtype=np.int64)[values.offset:values.offset + len(values) + 1]
+    data = np.frombuffer(values.buffers()[2], dtype=np.uint8)[offsets[0]:offsets[-1]]
+    validity = values.is_valid().buffers()[1] if values.null_count else None
+    return pa.LargeStringArray.from_buffers(
+        len(values),
+        pa.py_buffer((offsets - offsets[0]) * 2),
+        pa.py_buffer(_HEX_DIGITS[data].view(np.uint8)),
+        validity,
+        values.null_count,
+    )
 
-        # Create GeoDataFrame with new 'geom' column
-        gdf = gpd.GeoDataFrame(df, geometry="geom", crs="EPSG:4326")
-        yield gdf
 
+def prefix_text(prefix: str, values: pa.Array) -> pa.Array:
+    empty = pa.scalar("", pa.large_string())
+    return pc.binary_join_element_wise(pa.scalar(prefix, pa.large_string()), values, empty)
+
+
+_WKB_POINT = np.dtype([("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")])  # packed, 21 bytes
+
+
+def points_wkb(x: pa.Array, y: pa.Array) -> pa.Array:
+    """
+    Little-endian WKB points straight from coordinate arrays: one numpy record
+    per row, no Shapely objects. Rows with a null/NaN coordinate become null.
+    """
+    x = x.to_numpy(zero_copy_only=False).astype(np.float64)
+    y = y.to_numpy(zero_copy_only=False).astype(np.float64)
+    n = len(x)
+    records = np.empty(n, dtype=_WKB_POINT)
+    records["order"] = 1
+    records["type"] = 1
+    records["x"] = x
+    records["y"] = y
+    valid = np.isfinite(x) & np.isfinite(y)
+    null_count = int(n - valid.sum())
+    validity = pa.array(valid).buffers()[1] if null_count else None
+    offsets = np.arange(0, _WKB_POINT.itemsize * (n + 1), _WKB_POINT.itemsize, dtype=np.int32)
+    return pa.Array.from_buffers(
+        pa.binary(), n, [validity, pa.py_buffer(offsets), pa.py_buffer(records)], null_count=null_count
+    )
+
+
+def wkb_to_ewkb_text(wkb_values: pa.Array, srid: Optional[int] = None) -> pa.Array:
+    """WKB → 'SRID=4326;<hex>' text, which PostGIS parses straight into geometry (SRID by default)."""
+    srid = SRID if srid is None else srid  # read at call time, so a configure()d SRID applies
+    return prefix_text(f"SRID={srid};", hex_encode(wkb_values))
+
+
+_PG_TYPES = {
+    pa.bool_(): "boolean",
+    pa.int8(): "smallint", pa.int16(): "smallint", pa.int32(): "integer", pa.int64(): "bigint",
+    pa.uint8(): "smallint", pa.uint16(): "integer", pa.uint32(): "bigint", pa.uint64(): "numeric",
+    pa.float16(): "real", pa.float32(): "real", pa.float64(): "double precision",
+    pa.string(): "text", pa.large_string(): "text",
+    pa.binary(): "bytea", pa.large_binary(): "bytea",
+    pa.date32(): "date", pa.date64(): "date",
+}
+
+
+def pg_type(arrow_type: pa.DataType) -> str:
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if pa.types.is_timestamp(arrow_type):
+        return "timestamptz" if arrow_type.tz else "timestamp"
+    if pa.types.is_decimal(arrow_type):
+        return "numeric"
+    return _PG_TYPES.get(arrow_type, "text")
+
+
+def column_pg_type(field: pa.Field) -> str:
+    """
+    PostGIS type for a batch column. Coordinates stay double precision even when
+    compact_schema() carries them as float32: COPY writes the shortest float32
+    text ("40.7"), which a double column stores as the original value.
+    """
+    if field.name in COORD_COLUMNS and pa.types.is_floating(field.type):
+        return "double precision"
+    return pg_type(field.type)
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def qualified(table_name: str) -> str:
+    return f"{quote_ident(SCHEMA)}.{quote_ident(table_name)}"
+
+
+def postgis_geometry_type(geo_meta: dict) -> str:
+    """Pick a typed geometry column when GeoParquet says every row has one type ("Polygon Z" → POLYGONZ)."""
+    types = {t.replace(" ", "").upper() for t in geo_meta.get("geometry_types", [])}
+    return types.pop() if len(types) == 1 else "GEOMETRY"
+
+
+def create_table_sql(
+    table_name: str,
+    arrow_schema: pa.Schema,
+    geo_meta: dict,
+    if_not_exists: bool = False,
+    unlogged: bool = False,
+) -> str:
+    cols = [f"{quote_ident(f.name)} {column_pg_type(f)}" for f in arrow_schema if f.name != "geometry"]
+    cols.append(f"{quote_ident(GEOM_COLUMN)} geometry({postgis_geometry_type(geo_meta)}, {SRID})")
+    return (
+        f"CREATE {'UNLOGGED ' if unlogged else ''}TABLE {'IF NOT EXISTS ' if if_not_exists else ''}"
+        f"{qualified(table_name)} ({', '.join(cols)})"
+    )
+
+
+def table_columns(arrow_schema: pa.Schema) -> List[str]:
+    """PostGIS column names for an Arrow batch schema."""
+    return [GEOM_COLUMN if name == "geometry" else name for name in arrow_schema.names]
+
+
+def to_copy_table(table: pa.Table) -> pa.Table:
+    """Make every column CSV-writable; geometry becomes EWKB text."""
+    arrays, names = [], []
+    for field, column in zip(table.schema, table.columns):
+        if field.name == "geometry":
+            arrays.append(wkb_to_ewkb_text(column))
+            names.append(GEOM_COLUMN)
+            continue
+        if pa.types.is_dictionary(field.type):
+            column = column.cast(field.type.value_type)
+        elif pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type):
+            column = prefix_text("\\x", hex_encode(column))
+        arrays.append(column)
+        names.append(field.name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def copy_table(cursor, table_name: str, table: pa.Table, chunksize: Optional[int] = None):
+    """Stream an Arrow table into PostGIS with COPY ... FROM STDIN (CSV), CHUNKSIZE rows per COPY by default."""
+    chunksize = chunksize or CHUNKSIZE
+    table = to_copy_table(table)
+    columns = ", ".join(quote_ident(c) for c in table.column_names)
+    sql = f"COPY {qualified(table_name)} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    options = pacsv.WriteOptions(include_header=False)
+    for start in range(0, table.num_rows, chunksize):
+        sink = pa.BufferOutputStream()
+        pacsv.write_csv(table.slice(start, chunksize), sink, write_options=options)
+        cursor.copy_expert(sql, pa.BufferReader(sink.getvalue()))
+
+
+# ───────── Pipeline ─────────
+_DONE = object()  # end-of-stream marker passed between stages
+
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when another stage failed or the user interrupted."""
+
+
+class _Reorderer:
+    """Release (seq, item) pairs to a queue strictly in seq order."""
+
+    def __init__(self, out_q: queue.Queue, cancel: threading.Event):
+        self.out_q = out_q
+        self.cancel = cancel
+        self.next_seq = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def put(self, seq: int, item):
+        with self.lock:
+            self.pending[seq] = item
+            while self.next_seq in self.pending:
+                _put(self.out_q, (self.next_seq, self.pending.pop(self.next_seq)), self.cancel)
+                self.next_seq += 1
+
+
+def _put(q: queue.Queue, item, cancel: threading.Event):
+    """Blocking put that gives up as soon as the pipeline is cancelled."""
+    while True:
+        if cancel.is_set():
+            raise PipelineCancelled()
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, cancel: threading.Event):
+    """Blocking get that gives up as soon as the pipeline is cancelled."""
+    while True:
+        if cancel.is_set():
+            raise PipelineCancelled()
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+def _acquire(sem: threading.Semaphore, cancel: threading.Event):
+    while not sem.acquire(timeout=0.5):
+        if cancel.is_set():
+            raise PipelineCancelled()
+
+
+def transform_batch(table: pa.Table, geo_meta: dict) -> pa.Table:
+    """
+    Normalize geometry for one batch. WKB bytes pass straight through; geometries
+    are only materialized when the GeoParquet CRS is not EPSG:4326 or
+    VALIDATE_GEOMETRY is on. With GEOMETRY_SOURCE = "latlon" the points are
+    built from full-precision coordinates before any float32 downcast.
+    """
+    if GEOMETRY_SOURCE == "latlon":
+        points = points_wkb(table.column(LONGITUDE_COLUMN), table.column(LATITUDE_COLUMN))
+        return compact_batch(table.append_column("geometry", points))
+
+    idx = table.schema.get_field_index("geometry")
+    wkb_values = table.column(idx).combine_chunks()
+    if needs_reprojection(geo_meta.get("crs")):
+        wkb_values = force_epsg4326(wkb_values, geo_meta["crs"])
+    if VALIDATE_GEOMETRY:
+        wkb_values = make_valid_wkb(wkb_values)
+    return compact_batch(table.set_column(idx, "geometry", wkb_values))
 
 
 # ───────── Upload ─────────
-def upload_parquet_to_postgis(parquet_file: str, batch_size: int = BATCHSIZE):
+def prepare_target_table(arrow_schema: pa.Schema, geo_meta: dict, filters: Optional[Dict[str, Any]] = None):
+    """
+    Full load: drop and recreate the table. Filtered load: keep the table and
+    delete only the rows the filters select, so they can be reloaded.
+    """
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            if not filters:
+                cur.execute(f"DROP TABLE IF EXISTS {qualified(TABLE_NAME)}")
+            cur.execute(create_table_sql(TABLE_NAME, arrow_schema, geo_meta, if_not_exists=True))
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_ident(f'idx_{TABLE_NAME}_{GEOM_COLUMN}')} "
+                f"ON {qualified(TABLE_NAME)} USING GIST ({quote_ident(GEOM_COLUMN)})"
+            )
+            if filters:
+                where, params = filter_sql(filters, arrow_schema)
+                cur.execute(f"DELETE FROM {qualified(TABLE_NAME)} WHERE {where}", params)
+                print(f"🧹 Deleted {cur.rowcount} existing rows matching {filters}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ───────── Staging load ─────────
+def staging_table_name() -> str:
+    return f"{TABLE_NAME}__staging"
+
+
+def prepare_staging_table(
+    arrow_schema: pa.Schema,
+    geo_meta: dict,
+    filters: Optional[Dict[str, Any]] = None,
+    carry_over: bool = True,
+) -> str:
+    """
+    Create an UNLOGGED, index-free staging table. For a filtered refresh the live
+    rows outside the filter are copied in first (unless carry_over=False), so the
+    swap replaces only them.
+    """
+    stage = staging_table_name()
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {qualified(stage)}")
+            cur.execute(create_table_sql(stage, arrow_schema, geo_meta, unlogged=True))
+            cur.execute("SELECT to_regclass(%s)", (qualified(TABLE_NAME),))
+            if filters and carry_over and cur.fetchone()[0] is not None:
+                where, params = filter_sql(filters, arrow_schema)
+                cols = ", ".join(quote_ident(c) for c in table_columns(arrow_schema))
+                cur.execute(
+                    f"INSERT INTO {qualified(stage)} ({cols}) SELECT {cols} FROM {qualified(TABLE_NAME)} "
+                    f"WHERE NOT COALESCE({where}, false)",
+                    params,
+                )
+                print(f"📋 Carried over {cur.rowcount} live rows outside {filters}")
+        conn.commit()
+    finally:
+        conn.close()
+    return stage
+
+
+def drop_staging_table():
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {qualified(staging_table_name())}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def worker_staging_prefix() -> str:
+    return f"{TABLE_NAME}__stage_"  # + worker pid
+
+
+def drop_worker_staging_tables():
+    """Drop every per-process staging table left by parallel workers (PARALLEL_TARGET = "staging")."""
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT tablename FROM pg_tables WHERE schemaname = %s AND starts_with(tablename, %s)",
+                (SCHEMA, worker_staging_prefix()),
+            )
+            for (name,) in cur.fetchall():
+                cur.execute(f"DROP TABLE IF EXISTS {qualified(name)}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _run_maintenance(sql: str):
+    """Run one index/maintenance statement on its own connection."""
+    t0 = time.time()
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET maintenance_work_mem = %s", (INDEX_WORK_MEM,))
+            cur.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"   ✔ {sql.split(' ON ')[0]} ({time.time() - t0:.1f}s)")
+
+
+def finalize_staging_table(arrow_schema: pa.Schema):
+    """
+    Index the loaded staging table and swap it in. The indexes are built in
+    parallel, the table is ANALYZEd (and optionally CLUSTERed), and then, in a
+    single transaction, the live table is dropped and the staging table plus its
+    indexes are renamed into place. Readers see either the old or the new table.
+    """
+    stage = staging_table_name()
+    t0 = time.time()
+
+    if STAGING_SET_LOGGED:
+        print(f"📝 Making {stage} logged...")
+        _run_maintenance(f"ALTER TABLE {qualified(stage)} SET LOGGED")
+
+    # (index column, staging index name, final index name, CREATE INDEX statement)
+    indexes = [(
+        GEOM_COLUMN, f"idx_{stage}_{GEOM_COLUMN}", f"idx_{TABLE_NAME}_{GEOM_COLUMN}",
+        f"CREATE INDEX {quote_ident(f'idx_{stage}_{GEOM_COLUMN}')} ON {qualified(stage)} USING GIST ({quote_ident(GEOM_COLUMN)})",
+    )]
+    for col in INDEX_COLUMNS:
+        if col in arrow_schema.names:
+            indexes.append((
+                col, f"idx_{stage}_{col}", f"idx_{TABLE_NAME}_{col}",
+                f"CREATE INDEX {quote_ident(f'idx_{stage}_{col}')} ON {qualified(stage)} ({quote_ident(col)})",
+            ))
+
+    print(f"🗂️ Building {len(indexes)} indexes on {stage} ({INDEX_WORKERS} workers)...")
+    pending = [sql for _, _, _, sql in indexes]
+    if CLUSTER_ON_GEOMETRY:
+        # CLUSTER rewrites the table (and every index), so only the GiST index exists first.
+        _run_maintenance(pending.pop(0))
+        _run_maintenance(f"CLUSTER {qualified(stage)} USING {quote_ident(indexes[0][1])}")
+    with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as pool:
+        list(pool.map(_run_maintenance, pending))
+    _run_maintenance(f"ANALYZE {qualified(stage)}")
+
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {qualified(TABLE_NAME)}")
+            cur.execute(f"ALTER TABLE {qualified(stage)} RENAME TO {quote_ident(TABLE_NAME)}")
+            for _, stage_index, final_index, _ in indexes:
+                cur.execute(
+                    f"ALTER INDEX {quote_ident(SCHEMA)}.{quote_ident(stage_index)} RENAME TO {quote_ident(final_index)}"
+                )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"🔁 Swapped {stage} → {SCHEMA}.{TABLE_NAME} (indexes + swap took {time.time() - t0:.1f}s)")
+
+
+# ───────── Incremental merge ─────────
+def prepare_merge_tables(arrow_schema: pa.Schema, geo_meta: dict) -> str:
+    """Make sure the live table and its key index exist, then stage the release."""
+    missing = [k for k in MERGE_KEYS if k not in arrow_schema.names]
+    if missing:
+        raise ValueError(f"❌ Merge keys {missing} are not among the loaded columns")
+    keys = ", ".join(quote_ident(k) for k in MERGE_KEYS)
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(create_table_sql(TABLE_NAME, arrow_schema, geo_meta, if_not_exists=True))
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_ident(f'idx_{TABLE_NAME}_{GEOM_COLUMN}')} "
+                f"ON {qualified(TABLE_NAME)} USING GIST ({quote_ident(GEOM_COLUMN)})"
+            )
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {quote_ident(f'idx_{TABLE_NAME}_merge_key')} "
+                f"ON {qualified(TABLE_NAME)} ({keys})"
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return prepare_staging_table(arrow_schema, geo_meta, carry_over=False)
+
+
+def merge_staging_table(arrow_schema: pa.Schema, filters: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Diff the staged release against the live table by MERGE_KEYS plus an md5 row
+    hash of every other column (geometry included), and apply the delta with three
+    set-based statements in one transaction. With filters, deletes are limited to
+    the filtered slice, so rows outside it are never treated as gone.
+    Returns churn statistics.
+    """
+    stage = staging_table_name()
+    live, staged = qualified(TABLE_NAME), qualified(stage)
+    cols = table_columns(arrow_schema)
+    values = [c for c in cols if c not in MERGE_KEYS]
+    key_match = " AND ".join(f"l.{quote_ident(k)} = s.{quote_ident(k)}" for k in MERGE_KEYS)
+
+    def row_hash(alias: str) -> str:
+        return f"md5(ROW({', '.join(f'{alias}.{quote_ident(c)}' for c in values)})::text)"
+
+    t0 = time.time()
+    # Unique on the stage: a release with duplicate keys fails here, before touching live rows.
+    _run_maintenance(
+        f"CREATE UNIQUE INDEX {quote_ident(f'idx_{stage}_merge_key')} "
+        f"ON {staged} ({', '.join(quote_ident(k) for k in MERGE_KEYS)})"
+    )
+    _run_maintenance(f"ANALYZE {staged}")
+
+    scope, scope_params = filter_sql(filters, arrow_schema) if filters else ("true", [])
+    stats: Dict[str, int] = {}
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {staged}")
+            stats["staged"] = cur.fetchone()[0]
+
+            cur.execute(
+                f"DELETE FROM {live} l WHERE COALESCE({scope}, false) "
+                f"AND NOT EXISTS (SELECT 1 FROM {staged} s WHERE {key_match})",
+                scope_params,
+            )
+            stats["deleted"] = cur.rowcount
+
+            assignments = ", ".join(f"{quote_ident(c)} = s.{quote_ident(c)}" for c in values)
+            cur.execute(
+                f"UPDATE {live} l SET {assignments} FROM {staged} s "
+                f"WHERE {key_match} AND {row_hash('l')} IS DISTINCT FROM {row_hash('s')}"
+            )
+            stats["updated"] = cur.rowcount
+
+            col_list = ", ".join(quote_ident(c) for c in cols)
+            cur.execute(
+                f"INSERT INTO {live} ({col_list}) SELECT {', '.join(f's.{quote_ident(c)}' for c in cols)} "
+                f"FROM {staged} s WHERE NOT EXISTS (SELECT 1 FROM {live} l WHERE {key_match})"
+            )
+            stats["inserted"] = cur.rowcount
+            cur.execute(f"DROP TABLE {staged}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _run_maintenance(f"ANALYZE {live}")
+
+    stats["unchanged"] = stats["staged"] - stats["inserted"] - stats["updated"]
+    changed = stats["inserted"] + stats["updated"] + stats["deleted"]
+    churn = changed / stats["staged"] if stats["staged"] else 0.0
+    print(
+        f"📊 Merge into {SCHEMA}.{TABLE_NAME}: {stats['staged']} staged | {stats['inserted']} inserted | "
+        f"{stats['updated']} updated | {stats['deleted']} deleted | {stats['unchanged']} unchanged "
+        f"({churn:.2%} churn, {time.time() - t0:.1f}s)"
+    )
+    return stats
+
+
+def begin_load(arrow_schema: pa.Schema, geo_meta: dict, filters: Optional[Dict[str, Any]], load_mode: str) -> str:
+    """Prepare the table for `load_mode` and return the table batches are copied into."""
+    if load_mode == "staging":
+        return prepare_staging_table(arrow_schema, geo_meta, filters)
+    if load_mode == "merge":
+        return prepare_merge_tables(arrow_schema, geo_meta)
+    if load_mode == "replace":
+        prepare_target_table(arrow_schema, geo_meta, filters)
+        return TABLE_NAME
+    raise ValueError(f"❌ LOAD_MODE must be 'replace', 'staging' or 'merge', got {load_mode!r}")
+
+
+def finish_load(arrow_schema: pa.Schema, filters: Optional[Dict[str, Any]], load_mode: str):
+    """Publish a completed load: swap (staging) or apply the delta (merge)."""
+    if load_mode == "staging":
+        finalize_staging_table(arrow_schema)
+    elif load_mode == "merge":
+        merge_staging_table(arrow_schema, filters)
+
+
+def abort_load(load_mode: str):
+    """Throw away a failed load; the live table is untouched in staging/merge modes."""
+    if load_mode in ("staging", "merge"):
+        drop_staging_table()
+    drop_worker_staging_tables()
+
+
+def upload_parquet_to_postgis(
+    parquet_file: str,
+    batch_size: int = BATCHSIZE,
+    transform_workers: int = TRANSFORM_WORKERS,
+    upload_workers: int = UPLOAD_WORKERS,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    ordered: bool = ORDERED_COMMIT,
+    filters: Optional[Dict[str, Any]] = FILTERS,
+    load_mode: str = LOAD_MODE,
+):
+    """
+    Pipelined upload: one reader thread feeds a pool of transform workers, which
+    feed `upload_workers` writer threads, each holding its own DB connection.
+
+    - Back-pressure: at most `max_in_flight` batches exist between read and commit.
+    - ordered=True: each batch is inserted concurrently but committed in parquet
+      order, so the table always holds a prefix of the file.
+    - ordered=False: every writer commits as soon as its insert finishes.
+    - Any stage error (or Ctrl+C) cancels all stages; uncommitted batches roll back.
+    - filters: only matching rows are read, and only those rows are replaced.
+    - load_mode="staging": batches go to an UNLOGGED staging table that is indexed
+      and swapped in only after every batch committed.
+    - load_mode="merge": batches are staged, then only the delta is applied.
+    """
     if not os.path.exists(parquet_file):
         raise FileNotFoundError(f"❌ Input file not found: {parquet_file}")
 
-    print(f"📂 Streaming from {parquet_file} in batches of {batch_size} rows...")
-    first = True
-    total_uploaded = 0
+    geo_meta = load_geo_metadata(parquet_file)
+
+    print(
+        f"📂 Streaming from {parquet_file} in batches of {batch_size} rows "
+        f"({transform_workers} transform / {upload_workers} writer workers, "
+        f"{'ordered' if ordered else 'unordered'} commits)..."
+    )
+
+    arrow_schema = load_schema(open_parquet_dataset(parquet_file))
+    target = begin_load(arrow_schema, geo_meta, filters, load_mode)
+
+    cancel = threading.Event()
+    errors: List[BaseException] = []
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    read_q: queue.Queue = queue.Queue(maxsize=max_in_flight)
+    write_q: queue.Queue = queue.Queue(maxsize=max_in_flight)
+    reorderer = _Reorderer(write_q, cancel) if ordered else None
+
+    commit_cond = threading.Condition()
+    state = {"next_commit": 0, "uploaded": 0, "transformers_left": transform_workers}
+
+    def fail(exc: BaseException):
+        if not isinstance(exc, PipelineCancelled):
+            errors.append(exc)
+        cancel.set()
+
+    def reader():
+        try:
+            seq = 0
+            for table in stream_parquet_batches(parquet_file, batch_size, filters):
+                _acquire(in_flight, cancel)
+                _put(read_q, (seq, table), cancel)
+                seq += 1
+            for _ in range(transform_workers):
+                _put(read_q, _DONE, cancel)
+        except BaseException as e:
+            fail(e)
+
+    def transformer():
+        try:
+            while True:
+                item = _get(read_q, cancel)
+                if item is _DONE:
+                    break
+                seq, table = item
+                if table.num_rows:
+                    table = transform_batch(table, geo_meta)
+                if reorderer is not None:
+                    reorderer.put(seq, table)
+                else:
+                    _put(write_q, (seq, table), cancel)
+            with commit_cond:
+                state["transformers_left"] -= 1
+                last = state["transformers_left"] == 0
+            if last:
+                for _ in range(upload_workers):
+                    _put(write_q, _DONE, cancel)
+        except BaseException as e:
+            fail(e)
+
+    def wait_turn(seq: int):
+        with commit_cond:
+            while state["next_commit"] != seq:
+                if cancel.is_set():
+                    raise PipelineCancelled()
+                commit_cond.wait(timeout=0.5)
+
+    def writer():
+        try:
+            conn = get_engine().raw_connection()
+            try:
+                while True:
+                    item = _get(write_q, cancel)
+                    if item is _DONE:
+                        break
+                    seq, table = item
+                    try:
+                        if table.num_rows:
+                            print(f"📤 Uploading batch {seq} ({table.num_rows} rows)...")
+                            with conn.cursor() as cur:
+                                copy_table(cur, target, table)
+                        if ordered:
+                            wait_turn(seq)
+                        conn.commit()
+                    except BaseException:
+                        conn.rollback()
+                        raise
+                    with commit_cond:
+                        state["next_commit"] += 1
+                        state["uploaded"] += table.num_rows
+                        total = state["uploaded"]
+                        commit_cond.notify_all()
+                    in_flight.release()
+                    if table.num_rows:
+                        print(f"✅ Uploaded {total} rows so far...")
+            finally:
+                conn.close()
+        except BaseException as e:
+            fail(e)
+
+    threads = [threading.Thread(target=reader, name="reader", daemon=True)]
+    threads += [threading.Thread(target=transformer, name=f"transform-{i}", daemon=True) for i in range(transform_workers)]
+    threads += [threading.Thread(target=writer, name=f"writer-{i}", daemon=True) for i in range(upload_workers)]
+
+    t0 = time.time()
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
+    except KeyboardInterrupt:
+        print("\n🛑 Cancelling upload, rolling back in-flight batches...")
+        cancel.set()
+        for t in threads:
+            t.join()
+        abort_load(load_mode)
+        raise
+
+    if errors:
+        abort_load(load_mode)
+        raise errors[0]
+
+    finish_load(arrow_schema, filters, load_mode)
+
+    elapsed = time.time() - t0
+    total_uploaded = state["uploaded"]
+    rate = total_uploaded / elapsed if elapsed > 0 else 0.0
+    print(f"🎉 Done! Total uploaded: {total_uploaded} rows → {SCHEMA}.{TABLE_NAME} ({rate:,.0f} rows/s)")
+
+
+# ───────── Multi-process upload ─────────
+def upload_worker_settings() -> Dict[str, Any]:
+    """The module settings (upper-case globals, incl. DB_URL) as configure()/the CLI left them."""
+    return {
+        name: value for name, value in globals().items()
+        if name.isupper() and not name.startswith("_") and not callable(value)
+    }
+
+
+def _init_upload_worker(settings: Dict[str, Any]):
+    global engine
+    # Never reuse pooled connections inherited from the coordinator (fork start method).
+    if engine is not None:
+        engine.dispose(close=False)
+    # configure()/CLI overrides don't survive the spawn start method: restore them
+    # and connect to the coordinator's database.
+    globals().update(settings)
+    engine = create_engine(DB_URL) if DB_URL else None
 
-    for gdf in stream_parquet_batches(parquet_file, batch_size):
-        if gdf.empty:
-            continue
 
-        # Normalize CRS and filter columns
-        gdf = force_epsg4326(gdf)
-        gdf = apply_select_columns(gdf, SELECT_COLUMNS)
+def plan_row_group_tasks(parquet_file: str, filters: Optional[Dict[str, Any]], per_task: int) -> List[tuple]:
+    """Split the dataset into (file path, [row group ids]) tasks, skipping pruned row groups."""
+    dataset = open_parquet_dataset(parquet_file, filters)
+    expr = build_filter(filters, dataset.schema)
+    tasks = []
+    for fragment in dataset.get_fragments():
+        if expr is not None:
+            ids = [rg.row_groups[0].id for rg in fragment.split_by_row_group(expr)]
+        else:
+            ids = list(range(fragment.num_row_groups))
+        for start in range(0, len(ids), per_task):
+            tasks.append((fragment.path, ids[start:start + per_task]))
+    return tasks
 
-        # Upload this batch
-        print(f"📤 Uploading {len(gdf)} rows...")
-        gdf.to_postgis(
-            TABLE_NAME,
-            engine,
-            schema=SCHEMA,
-            if_exists="replace" if first else "append",
-            index=False,
-            chunksize=CHUNKSIZE,
-        )
-        total_uploaded += len(gdf)
-        first = False
-        print(f"✅ Uploaded {total_uploaded} rows so far...")
 
-    print(f"🎉 Done! Total uploaded: {total_uploaded} rows → {SCHEMA}.{TABLE_NAME}")
+def upload_row_group_range(
+    parquet_file: str,
+    path: str,
+    row_groups: List[int],
+    batch_size: int,
+    filters: Optional[Dict[str, Any]],
+    geo_meta: dict,
+    target: str,
+    load_table: str = TABLE_NAME,
+) -> tuple:
+    """
+    Worker: decode one row-group range and COPY it in a single transaction, so a
+    failed range leaves nothing behind and can simply be retried.
+    Returns (rows, target table).
+    """
+    dataset = open_parquet_dataset(parquet_file, filters)
+    columns = apply_select_columns(dataset.schema.names, SELECT_COLUMNS)
+    expr = build_filter(filters, dataset.schema)
+    fragment = parquet_format(filters).make_fragment(path, filesystem=dataset.filesystem, row_groups=row_groups)
+
+    table_name = load_table if target == "table" else f"{worker_staging_prefix()}{os.getpid()}"
+    rows = 0
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            if target == "staging":
+                cur.execute(
+                    f"CREATE UNLOGGED TABLE IF NOT EXISTS {qualified(table_name)} "
+                    f"(LIKE {qualified(load_table)} INCLUDING DEFAULTS)"
+                )
+            for batch in fragment.to_batches(schema=dataset.schema, columns=columns, filter=expr, batch_size=batch_size):
+                if not batch.num_rows:
+                    continue
+                table = transform_batch(pa.Table.from_batches([batch]), geo_meta)
+                copy_table(cur, table_name, table)
+                rows += table.num_rows
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows, table_name
+
+
+def merge_staging_tables(staging_tables: List[str], load_table: str = TABLE_NAME):
+    """Move per-worker staging tables into `load_table` in one transaction."""
+    conn = get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            for name in staging_tables:
+                cur.execute(f"INSERT INTO {qualified(load_table)} SELECT * FROM {qualified(name)}")
+                cur.execute(f"DROP TABLE {qualified(name)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def parallel_upload_parquet_to_postgis(
+    parquet_file: str,
+    batch_size: int = BATCHSIZE,
+    processes: int = PROCESS_WORKERS,
+    filters: Optional[Dict[str, Any]] = FILTERS,
+    per_task: int = ROW_GROUPS_PER_TASK,
+    retries: int = TASK_RETRIES,
+    target: str = PARALLEL_TARGET,
+    load_mode: str = LOAD_MODE,
+):
+    """
+    Coordinator for the multi-process mode: row-group ranges are handed to
+    `processes` workers, failed ranges are retried up to `retries` times, and
+    aggregate progress (rows, rows/s) is reported as ranges complete.
+    """
+    if not os.path.exists(parquet_file):
+        raise FileNotFoundError(f"❌ Input file not found: {parquet_file}")
+    if target not in ("table", "staging"):
+        raise ValueError(f"❌ PARALLEL_TARGET must be 'table' or 'staging', got {target!r}")
+
+    geo_meta = load_geo_metadata(parquet_file)
+
+    tasks = plan_row_group_tasks(parquet_file, filters, per_task)
+    print(f"📂 Uploading {parquet_file}: {len(tasks)} row-group ranges across {processes} processes ({target})...")
+
+    arrow_schema = load_schema(open_parquet_dataset(parquet_file))
+    load_table = begin_load(arrow_schema, geo_meta, filters, load_mode)
+
+    attempts = {i: 0 for i in range(len(tasks))}
+    failed: Dict[int, BaseException] = {}
+    staging_tables = set()
+    total_rows = done = 0
+    t0 = time.time()
+
+    settings = upload_worker_settings()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_upload_worker, initargs=(settings,)) as pool:
+        def submit(i: int):
+            attempts[i] += 1
+            path, row_groups = tasks[i]
+            return pool.submit(
+                upload_row_group_range,
+                parquet_file, path, row_groups, batch_size, filters, geo_meta, target, load_table,
+            )
+
+        pending = {submit(i): i for i in range(len(tasks))}
+        try:
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    i = pending.pop(fut)
+                    path, row_groups = tasks[i]
+                    try:
+                        rows, table_name = fut.result()
+                    except Exception as e:
+                        if attempts[i] <= retries:
+                            print(f"⚠️ Row groups {row_groups} failed ({e!r}); retry {attempts[i]}/{retries}")
+                            try:
+                                pending[submit(i)] = i
+                            except BrokenProcessPool as broken:  # a worker died; the pool takes no more tasks
+                                print(f"❌ Row groups {row_groups} cannot be retried: {broken!r}")
+                                failed[i] = broken
+                        else:
+                            print(f"❌ Row groups {row_groups} failed after {attempts[i]} attempts: {e!r}")
+                            failed[i] = e
+                        continue
+                    done += 1
+                    total_rows += rows
+                    staging_tables.add(table_name)
+                    elapsed = time.time() - t0
+                    print(
+                        f"✅ [{done}/{len(tasks)}] row groups {row_groups[0]}–{row_groups[-1]}: {rows} rows "
+                        f"(total {total_rows}, {total_rows / elapsed:,.0f} rows/s)"
+                    )
+        except KeyboardInterrupt:
+            print("\n🛑 Cancelling upload; in-flight ranges roll back...")
+            pool.shutdown(wait=True, cancel_futures=True)
+            abort_load(load_mode)
+            raise
+
+    if failed:
+        abort_load(load_mode)  # never publish a partial load, nor merge it into the load table
+        ranges = [tasks[i][1] for i in sorted(failed)]
+        raise RuntimeError(f"❌ {len(failed)} row-group ranges failed: {ranges}") from next(iter(failed.values()))
+
+    if target == "staging":
+        staging_tables.discard(load_table)
+        print(f"🔀 Merging {len(staging_tables)} staging tables into {SCHEMA}.{load_table}...")
+        merge_staging_tables(sorted(staging_tables), load_table)
+
+    finish_load(arrow_schema, filters, load_mode)
+
+    elapsed = time.time() - t0
+    rate = total_rows / elapsed if elapsed > 0 else 0.0
+    print(f"🎉 Done! Total uploaded: {total_rows} rows → {SCHEMA}.{TABLE_NAME} ({rate:,.0f} rows/s)")
 
 
 # ───────── MAIN ─────────
+def parse_filters(items: List[str]) -> Optional[Dict[str, Any]]:
+    """["state_usps=NY,NJ", "technology=50"] → {"state_usps": ["NY", "NJ"], "technology": ["50"]}"""
+    filters: Dict[str, Any] = {}
+    for item in items:
+        col, sep, values = item.partition("=")
+        if not sep or not col or not values:
+            raise ValueError(f"❌ Bad --filter '{item}', expected COLUMN=VALUE[,VALUE...]")
+        filters.setdefault(col.strip(), []).extend(v.strip() for v in values.split(","))
+    return filters or None
+
+
 def main():
-    upload_parquet_to_postgis(INPUT_FILE, BATCHSIZE)
+    global GEOMETRY_SOURCE
+    ap = argparse.ArgumentParser(description=f"Stream GeoParquet → PostGIS ({SCHEMA}.{TABLE_NAME}).")
+    ap.add_argument("--input", default=INPUT_FILE, help="Input GeoParquet file")
+    ap.add_argument("--batch-size", type=int, default=BATCHSIZE, help="Rows read from parquet at a time")
+    ap.add_argument(
+        "--filter", action="append", default=[], metavar="COLUMN=VALUE[,VALUE...]",
+        help="Only load (and replace) matching rows, e.g. --filter state_usps=NY; repeat to AND filters",
+    )
+    ap.add_argument(
+        "--processes", type=int, default=PROCESS_WORKERS,
+        help="Upload row-group ranges from N worker processes (0 = threaded pipeline)",
+    )
+    ap.add_argument(
+        "--load-mode", choices=["replace", "staging", "merge"], default=LOAD_MODE,
+        help="replace = load the live table directly; staging = load, index and swap atomically; "
+             "merge = apply only the inserts/updates/deletes of a new release",
+    )
+    ap.add_argument(
+        "--geometry-source", choices=["wkb", "latlon"], default=GEOMETRY_SOURCE,
+        help="wkb = stored geometry column; latlon = build points from latitude/longitude",
+    )
+    args = ap.parse_args()
+
+    GEOMETRY_SOURCE = args.geometry_source
+    filters = parse_filters(args.filter) or FILTERS
+    if args.processes > 0:
+        parallel_upload_parquet_to_postgis(args.input, args.batch_size, args.processes, filters, load_mode=args.load_mode)
+    else:
+        upload_parquet_to_postgis(args.input, args.batch_size, filters=filters, load_mode=args.load_mode)
 
 
 if __name__ == "__main__":
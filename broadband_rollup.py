@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import h3  # python-h3 (v3 API)
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+
+import broadband as bb
+
+# ───────── CONFIGURATION ─────────
+INPUT_FILE     = bb.INPUT_FILE
+OUTPUT_DIR     = r"D:\CIR\prefect_ELT\broadband_rollup"
+TABLE_PREFIX   = "us_broadband_h3"      # → us_broadband_h3_res8, us_broadband_h3_res6, ...
+BATCHSIZE      = 1_000_000              # rows read from parquet at a time
+
+H3_COLUMN          = "h3_res8_id"
+TECHNOLOGY_COLUMN  = "technology"
+PROVIDER_COLUMN    = "provider_id"
+DOWNLOAD_COLUMN    = "max_advertised_download_speed"
+UPLOAD_COLUMN      = "max_advertised_upload_speed"
+LOW_LATENCY_COLUMN = "low_latency"
+
+# Coarser parents rolled up from the same pass (the column's own resolution is always written)
+PARENT_RESOLUTIONS = [6]
+# Partial (cell, technology, provider) aggregates are re-grouped once they exceed this many rows
+COMPACT_ROWS       = 5_000_000
+UPLOAD_TO_POSTGIS  = True
+
+_PARTIAL_KEYS = ["h3", TECHNOLOGY_COLUMN, PROVIDER_COLUMN]
+_PARTIAL_AGGS = [("max_down", "max"), ("max_up", "max"), ("offers", "sum"), ("low_latency", "sum")]
+
+
+# ───────── Aggregation ─────────
+def _plain(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Dictionary columns → their values, so partials from different batches concatenate."""
+    if pa.types.is_dictionary(column.type):
+        return column.cast(column.type.value_type)
+    return column
+
+
+def group(table: pa.Table, keys: List[str], aggs: List[tuple]) -> pa.Table:
+    """Arrow hash group-by that keeps the input column names (no '_max'/'_sum' suffixes)."""
+    out = table.group_by(keys, use_threads=True).aggregate(aggs)
+    names = [f"{col}_{fn}" for col, fn in aggs]
+    return out.select(keys + names).rename_columns(keys + [col for col, _ in aggs])
+
+
+def partial_rollup(batch: pa.Table) -> pa.Table:
+    """
+    One batch → per (cell, technology, provider) maxima and counts. Providers are
+    kept in the key so provider counts stay exact when partials are merged.
+    """
+    batch = batch.filter(pc.is_valid(batch[H3_COLUMN]))
+    low_latency = _plain(batch[LOW_LATENCY_COLUMN]).cast(pa.int64())
+    table = pa.table({
+        "h3": _plain(batch[H3_COLUMN]),
+        TECHNOLOGY_COLUMN: _plain(batch[TECHNOLOGY_COLUMN]),
+        PROVIDER_COLUMN: _plain(batch[PROVIDER_COLUMN]),
+        "max_down": _plain(batch[DOWNLOAD_COLUMN]),
+        "max_up": _plain(batch[UPLOAD_COLUMN]),
+        "offers": pa.chunked_array([np.ones(batch.num_rows, dtype=np.int64)], type=pa.int64()),
+        "low_latency": pc.fill_null(low_latency, 0),
+    })
+    return group(table, _PARTIAL_KEYS, _PARTIAL_AGGS)
+
+
+def compact(partials: List[pa.Table]) -> pa.Table:
+    """Merge partial aggregates (max of maxima, sum of counts)."""
+    return group(pa.concat_tables(partials), _PARTIAL_KEYS, _PARTIAL_AGGS)
+
+
+def finalize_rollup(partial: pa.Table) -> pa.Table:
+    """(cell, technology, provider) partials → one row per (cell, technology)."""
+    out = partial.group_by(["h3", TECHNOLOGY_COLUMN], use_threads=True).aggregate([
+        ("max_down", "max"),
+        ("max_up", "max"),
+        (PROVIDER_COLUMN, "count"),
+        ("offers", "sum"),
+        ("low_latency", "sum"),
+    ])
+    share = pc.divide(out["low_latency_sum"].cast(pa.float64()), out["offers_sum"].cast(pa.float64()))
+    return pa.table({
+        "h3": out["h3"],
+        TECHNOLOGY_COLUMN: out[TECHNOLOGY_COLUMN],
+        "max_download_speed": out["max_down_max"],
+        "max_upload_speed": out["max_up_max"],
+        "provider_count": out[f"{PROVIDER_COLUMN}_count"].cast(pa.int32()),
+        "offer_count": out["offers_sum"],
+        "low_latency_share": share.cast(pa.float32()),
+    })
+
+
+def to_parent(partial: pa.Table, resolution: int) -> pa.Table:
+    """Re-key partials on their parent cell; each distinct cell is looked up once."""
+    cells = partial["h3"].combine_chunks().dictionary_encode()
+    parents = pa.array([h3.h3_to_parent(c, resolution) for c in cells.dictionary.to_pylist()], type=pa.string())
+    return group(partial.set_column(0, "h3", parents.take(cells.indices)), _PARTIAL_KEYS, _PARTIAL_AGGS)
+
+
+def h3_polygons_wkb(cells: pa.Array) -> pa.Array:
+    """H3 cells → WKB polygons (lon/lat), built in one vectorized Shapely call."""
+    cells = cells.to_pylist()
+    rings = [h3.h3_to_geo_boundary(c, geo_json=True) for c in cells]  # closed (lng, lat) rings
+    coords = np.array([xy for ring in rings for xy in ring], dtype=np.float64)
+    indices = np.repeat(np.arange(len(rings)), [len(ring) for ring in rings])
+    polygons = shapely.polygons(shapely.linearrings(coords, indices=indices))
+    return pa.array(shapely.to_wkb(polygons), type=pa.binary())
+
+
+def stream_rollup(parquet_file: str, batch_size: int, filters: Optional[Dict[str, Any]] = None) -> pa.Table:
+    """Single streaming pass: partial group-by per batch, compacted whenever it grows."""
+    dataset = ds.dataset(parquet_file, format=bb.parquet_format(filters))
+    columns = [H3_COLUMN, TECHNOLOGY_COLUMN, PROVIDER_COLUMN, DOWNLOAD_COLUMN, UPLOAD_COLUMN, LOW_LATENCY_COLUMN]
+    missing = [c for c in columns if c not in dataset.schema.names]
+    if missing:
+        raise ValueError(f"❌ Columns {missing} not found in parquet file")
+
+    partials: List[pa.Table] = []
+    pending = rows = 0
+    threshold = COMPACT_ROWS
+    t0 = time.time()
+    scanner = dataset.scanner(columns=columns, filter=bb.build_filter(filters, dataset.schema), batch_size=batch_size)
+    for batch in scanner.to_batches():
+        if batch.num_rows == 0:
+            continue
+        part = partial_rollup(pa.Table.from_batches([batch]))
+        partials.append(part)
+        pending += part.num_rows
+        rows += batch.num_rows
+        if pending > threshold:
+            partials = [compact(partials)]
+            pending = partials[0].num_rows
+            # Grow with the compacted size, so a large group count is not re-grouped every batch
+            threshold = max(COMPACT_ROWS, 2 * pending)
+        print(f"🔄 Aggregated {rows} rows ({pending} partial groups, {rows / (time.time() - t0):,.0f} rows/s)")
+
+    if not partials:
+        raise ValueError("❌ No rows to roll up")
+    return compact(partials)
+
+
+# ───────── Output ─────────
+def build_geo_metadata() -> Dict[bytes, bytes]:
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Polygon"]}},  # CRS default: OGC:CRS84
+    }
+    return {b"geo": json.dumps(geo).encode("utf-8")}
+
+
+def with_geometry(rollup: pa.Table) -> pa.Table:
+    """Attach one H3 polygon per row (cells repeat per technology, so each is built once)."""
+    cells = rollup["h3"].combine_chunks().dictionary_encode()
+    geometry = h3_polygons_wkb(cells.dictionary).take(cells.indices)
+    table = rollup.append_column("geometry", geometry)
+    return table.replace_schema_metadata(build_geo_metadata())
+
+
+def upload_rollup(table: pa.Table, table_name: str):
+    """Replace `table_name` with the rollup in one transaction, then index it."""
+    geo_meta = {"geometry_types": ["Polygon"]}
+    conn = bb.get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {bb.qualified(table_name)}")
+            cur.execute(bb.create_table_sql(table_name, table.schema, geo_meta))
+            bb.copy_table(cur, table_name, table)
+            cur.execute(
+                f"CREATE INDEX {bb.quote_ident(f'idx_{table_name}_{bb.GEOM_COLUMN}')} "
+                f"ON {bb.qualified(table_name)} USING GIST ({bb.quote_ident(bb.GEOM_COLUMN)})"
+            )
+            cur.execute(
+                f"CREATE INDEX {bb.quote_ident(f'idx_{table_name}_h3')} "
+                f"ON {bb.qualified(table_name)} (h3, {bb.quote_ident(TECHNOLOGY_COLUMN)})"
+            )
+            cur.execute(f"ANALYZE {bb.qualified(table_name)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"✅ Loaded {table.num_rows} rows → {bb.SCHEMA}.{table_name}")
+
+
+def rollup_broadband(
+    parquet_file: str,
+    output_dir: str,
+    batch_size: int = BATCHSIZE,
+    parent_resolutions: Optional[List[int]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    upload: bool = UPLOAD_TO_POSTGIS,
+):
+    t0 = time.time()
+    partial = stream_rollup(parquet_file, batch_size, filters)
+    base_resolution = h3.h3_get_resolution(partial["h3"][0].as_py())
+    parents = sorted({r for r in (PARENT_RESOLUTIONS if parent_resolutions is None else parent_resolutions)}, reverse=True)
+    if any(r >= base_resolution for r in parents):
+        raise ValueError(f"❌ Parent resolutions must be coarser than res {base_resolution}, got {parents}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    for resolution in [base_resolution] + parents:
+        if resolution != base_resolution:
+            partial = to_parent(partial, resolution)  # finer partials feed the next coarser level
+        table = with_geometry(finalize_rollup(partial))
+        out_path = os.path.join(output_dir, f"{TABLE_PREFIX}_res{resolution}.parquet")
+        pq.write_table(table, out_path)
+        print(f"💾 res {resolution}: {table.num_rows} (cell, technology) rows → {out_path}")
+        if upload:
+            upload_rollup(table, f"{TABLE_PREFIX}_res{resolution}")
+
+    print(f"🎉 Rollup done in {time.time() - t0:.1f}s")
+
+
+# ───────── MAIN ─────────
+def main():
+    ap = argparse.ArgumentParser(description="Roll broadband availability up to H3 cells per technology.")
+    ap.add_argument("--input", default=INPUT_FILE, help="Input broadband parquet file")
+    ap.add_argument("--output-dir", default=OUTPUT_DIR, help="Directory for the per-resolution GeoParquet files")
+    ap.add_argument("--batch-size", type=int, default=BATCHSIZE, help="Rows read from parquet at a time")
+    ap.add_argument(
+        "--parents", type=int, nargs="*", default=PARENT_RESOLUTIONS,
+        help="Coarser H3 resolutions to roll up to as well, e.g. --parents 6 4",
+    )
+    ap.add_argument(
+        "--filter", action="append", default=[], metavar="COLUMN=VALUE[,VALUE...]",
+        help="Only roll up matching rows, e.g. --filter state_usps=NY",
+    )
+    ap.add_argument("--no-upload", action="store_true", help="Write GeoParquet only, skip PostGIS")
+    args = ap.parse_args()
+
+    rollup_broadband(
+        args.input,
+        args.output_dir,
+        batch_size=args.batch_size,
+        parent_resolutions=args.parents,
+        filters=bb.parse_filters(args.filter),
+        upload=UPLOAD_TO_POSTGIS and not args.no_upload,
+    )
+
+
+if __name__ == "__main__":
+    main()
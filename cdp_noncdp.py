@@ -1,14 +1,16 @@
-import geopandas as gpd
-from sqlalchemy import create_engine, text
 import os
-from dotenv import load_dotenv
-
-# ───────── LOAD ENV FILE ─────────
-load_dotenv()
-DB_URL = os.getenv("DATABASE_URL")
-
-if not DB_URL:
-    raise ValueError("❌ DATABASE_URL not found in .env file")
+import json
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pyogrio.raw import read_arrow
+from pyproj import CRS, Transformer
+
+import broadband as bb  # COPY + staging loader; reads DATABASE_URL from .env
 
 # ───────── CONFIGURATION ─────────
 INPUT_FOLDER   = r"D:\CIR\TIGER2024_PLACE"                # folder with .zip shapefiles
@@ -16,69 +18,186 @@ PARQUET_FOLDER = os.path.join(INPUT_FOLDER, "parquet_states")  # output parquet
 TABLE_NAME     = "us_places"
 SCHEMA         = "public"
 CHUNKSIZE      = 50000
+CONVERT_WORKERS = os.cpu_count() or 4                         # states read/reprojected in parallel
+MANIFEST_FILE  = os.path.join(PARQUET_FOLDER, "manifest.json")  # source ZIP size/mtime per parquet
+
+# Load mode: "replace" = drop the live table and refill it (readers see a partial
+# table meanwhile); "staging" = load an UNLOGGED, index-free staging table, build
+# indexes in parallel, ANALYZE, then swap it in atomically.
+LOAD_MODE           = "replace"
+INDEX_COLUMNS       = ["statefp", "geoid", "name"]  # btree indexes built after a staging load
+INDEX_WORKERS       = 4
+INDEX_WORK_MEM      = "1GB"
+CLUSTER_ON_GEOMETRY = False
+STAGING_SET_LOGGED  = True
+
+# States mix Polygon and MultiPolygon, so the table gets a generic geometry column
+GEO_META = {"encoding": "WKB", "geometry_types": []}
 
 # Ensure parquet folder exists
 os.makedirs(PARQUET_FOLDER, exist_ok=True)
 
-# Create DB engine
-engine = create_engine(DB_URL)
+# Load through broadband's COPY/staging helpers, pointed at this table
+bb.configure(
+    TABLE_NAME=TABLE_NAME, SCHEMA=SCHEMA, GEOM_COLUMN="geometry",
+    INDEX_COLUMNS=INDEX_COLUMNS, INDEX_WORKERS=INDEX_WORKERS, INDEX_WORK_MEM=INDEX_WORK_MEM,
+    CLUSTER_ON_GEOMETRY=CLUSTER_ON_GEOMETRY, STAGING_SET_LOGGED=STAGING_SET_LOGGED,
+)
 
 # ───────── FUNCTION: normalize column names ─────────
-def normalize_columns(df):
-    df.columns = (
-        df.columns.str.strip()
-                  .str.lower()
-                  .str.replace(" ", "_")
-                  .str.replace("-", "_")
-    )
-    return df
+def normalize_columns(table):
+    return table.rename_columns([c.strip().lower().replace(" ", "_").replace("-", "_") for c in table.column_names])
 
 # ───────── STEP 1: Convert Shapefiles → GeoParquet ─────────
-print("🔄 Converting shapefiles to GeoParquet...")
-parquet_files = []
-
-for file in os.listdir(INPUT_FOLDER):
-    if file.endswith(".zip"):
-        state_file = os.path.join(INPUT_FOLDER, file)
-        state_name = os.path.splitext(file)[0]
-        parquet_file = os.path.join(PARQUET_FOLDER, f"{state_name}.parquet")
-
-        print(f"📂 Reading {file} ...")
-        gdf = gpd.read_file(state_file)
-
-        # Normalize CRS to EPSG:4326
-        if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
-            gdf = gdf.to_crs(epsg=4326)
-
-        # Normalize column names
-        gdf = normalize_columns(gdf)
+def zip_signature(zip_path):
+    stat = os.stat(zip_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+GEOMETRY_TYPE_NAMES = ["Point", "LineString", "LineString", "Polygon",  # shapely type id → GeoParquet name
+                       "MultiPoint", "MultiLineString", "MultiPolygon", "GeometryCollection"]
+
+
+def geo_metadata(geoms):
+    """GeoParquet metadata for lon/lat WGS84 WKB geometries."""
+    type_ids = np.unique(shapely.get_type_id(geoms[~shapely.is_missing(geoms)]))
+    types = sorted(GEOMETRY_TYPE_NAMES[t] for t in type_ids)
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {
+            "encoding": "WKB",
+            "geometry_types": types,
+            "crs": CRS.from_epsg(4326).to_json_dict(),
+            "bbox": [float(v) for v in shapely.total_bounds(geoms)],
+        }},
+    }
+    return {b"geo": json.dumps(geo).encode("utf-8")}
+
+
+def convert_state(zip_path, parquet_file):
+    """
+    Worker task: read the shapefile straight out of the ZIP as Arrow (/vsizip/,
+    no extraction, no per-feature Python objects), reproject to EPSG:4326,
+    normalize column names and write GeoParquet. The table is returned so the
+    upload does not have to read the parquet back.
+    """
+    t0 = time.time()
+    meta, table = read_arrow(f"/vsizip/{Path(zip_path).as_posix()}")
+    geom_name = meta["geometry_name"] or "wkb_geometry"
+    geoms = shapely.from_wkb(table.column(geom_name).to_numpy(zero_copy_only=False))
+
+    # Normalize CRS to EPSG:4326
+    crs = CRS.from_user_input(meta["crs"]) if meta["crs"] else None
+    if crs is not None and crs.to_epsg() != 4326:
+        transformer = Transformer.from_crs(crs, 4326, always_xy=True)
+        geoms = shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+    i = table.schema.get_field_index(geom_name)
+    table = table.set_column(i, "geometry", pa.array(shapely.to_wkb(geoms), pa.binary()))
+    table = normalize_columns(table).replace_schema_metadata(geo_metadata(geoms))
+
+    # Write next to the final name and swap, so a crash never leaves a parquet the manifest could trust
+    tmp = parquet_file + ".tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, parquet_file)
+    return table, time.time() - t0
+
+
+def converted_states():
+    """
+    Yield (state name, Arrow table) as states become available. Changed ZIPs are
+    submitted to the process pool first, so they convert while the unchanged
+    states are read back from their parquet and uploaded.
+    """
+    manifest = load_manifest()
+    zips = sorted((f for f in os.listdir(INPUT_FOLDER) if f.endswith(".zip")),
+                  key=lambda f: os.path.getsize(os.path.join(INPUT_FOLDER, f)), reverse=True)
+    cached, todo = [], []
+    for file in zips:
+        zip_path = os.path.join(INPUT_FOLDER, file)
+        parquet_file = os.path.join(PARQUET_FOLDER, f"{os.path.splitext(file)[0]}.parquet")
+        if manifest.get(file, {}).get("source") == zip_signature(zip_path) and os.path.exists(parquet_file):
+            cached.append((file, parquet_file))
+        else:
+            todo.append((file, zip_path, parquet_file))
+
+    print(f"🔄 Converting {len(todo)} shapefile ZIPs to GeoParquet ({len(cached)} unchanged)...")
+    with ProcessPoolExecutor(max_workers=CONVERT_WORKERS) as pool:
+        futures = {pool.submit(convert_state, zip_path, parquet_file): (file, zip_path, parquet_file)
+                   for file, zip_path, parquet_file in todo}
+        try:
+            for file, parquet_file in cached:
+                print(f"⏭️ {file} unchanged, using {os.path.basename(parquet_file)}")
+                yield os.path.splitext(file)[0], pq.read_table(parquet_file)
+            for future in as_completed(futures):
+                file, zip_path, parquet_file = futures[future]
+                table, seconds = future.result()
+                manifest[file] = {"source": zip_signature(zip_path), "parquet": parquet_file, "rows": table.num_rows}
+                save_manifest(manifest)
+                print(f"✅ Saved {table.num_rows} rows to {parquet_file} ({seconds:.1f}s)")
+                yield os.path.splitext(file)[0], table
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
 
-        # Save to GeoParquet
-        gdf.to_parquet(parquet_file, index=False)
-        parquet_files.append(parquet_file)
-        print(f"✅ Saved {len(gdf)} rows to {parquet_file}")
-
-print(f"🎉 Finished converting {len(parquet_files)} states to GeoParquet with crs 4326.")
 
 # ───────── STEP 2: Upload GeoParquet → PostGIS ─────────
-print("🚀 Uploading GeoParquet files to PostGIS...")
-
-first = True  # first file will replace, others append
-
-for parquet_file in parquet_files:
-    print(f"📂 Uploading {os.path.basename(parquet_file)} ...")
-    gdf = gpd.read_parquet(parquet_file)
-
-    gdf.to_postgis(
-        TABLE_NAME,
-        engine,
-        schema=SCHEMA,
-        if_exists="replace" if first else "append",
-        index=False,
-        chunksize=CHUNKSIZE
-    )
-
-    print(f"✅ Uploaded {len(gdf)} rows from {os.path.basename(parquet_file)}")
-    first = False
-
-print(f"🎉 All data uploaded to {SCHEMA}.{TABLE_NAME} in PostGIS")
\ No newline at end of file
+def copy_state(load_table, table):
+    """COPY one state's Arrow table in its own transaction."""
+    conn = bb.get_engine().raw_connection()
+    try:
+        with conn.cursor() as cur:
+            bb.copy_table(cur, load_table, table, CHUNKSIZE)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def upload_states():
+    """Upload each state as soon as it is available, while the pool keeps converting the rest."""
+    print(f"🚀 Uploading states to PostGIS ({LOAD_MODE})...")
+
+    if LOAD_MODE not in ("replace", "staging"):
+        raise ValueError(f"❌ LOAD_MODE must be 'replace' or 'staging', got {LOAD_MODE!r}")
+    load_table = arrow_schema = None
+    states = 0
+
+    try:
+        for state_name, table in converted_states():
+            print(f"📂 Uploading {state_name} ...")
+            if load_table is None:  # first state: drop/recreate the table, or create the staging table
+                arrow_schema = table.schema
+                load_table = bb.begin_load(arrow_schema, GEO_META, None, LOAD_MODE)
+            copy_state(load_table, table)
+            print(f"✅ Uploaded {table.num_rows} rows from {state_name}")
+            states += 1
+    except BaseException:
+        bb.abort_load(LOAD_MODE)
+        raise
+
+    if load_table is not None:
+        bb.finish_load(arrow_schema, None, LOAD_MODE)
+
+    print(f"🎉 {states} states uploaded to {SCHEMA}.{TABLE_NAME} in PostGIS")
+
+
+if __name__ == "__main__":
+    upload_states()
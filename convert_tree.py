@@ -0,0 +1,143 @@
+import os
+import sys
+import csv
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import geojsonTOgeoparquet
+import parquetTOgeojson
+
+INPUT_ROOT = r"D:\CIR\state"
+OUTPUT_ROOT = r"D:\CIR\state_geoparquet"
+TO = "parquet"                      # "parquet": *.geojson → *.parquet, "geojson": *.parquet → *.geojson
+WORKERS = os.cpu_count() or 4
+MANIFEST_NAME = "manifest.csv"
+INCLUDE_JSON = False                # also treat *.json as GeoJSON input (only if every .json under the root is one)
+
+# target format → (input suffixes, output suffix)
+CONVERSIONS = {
+    "parquet": ((".geojson",), ".parquet"),
+    "geojson": ((".parquet", ".geoparquet"), ".geojson"),
+}
+MANIFEST_FIELDS = ["input", "output", "status", "rows", "input_bytes", "output_bytes", "seconds", "error"]
+
+
+def plan(input_root: Path, output_root: Path, to: str, force: bool = False, include_json: bool = INCLUDE_JSON):
+    """Mirror the input tree: [(input, output, status)], largest inputs first, 'skipped' when up to date."""
+    suffixes, out_suffix = CONVERSIONS[to]
+    if include_json and to == "parquet":
+        suffixes += (".json",)
+    jobs = []
+    for src in input_root.rglob("*"):
+        if not src.is_file() or src.suffix.lower() not in suffixes:
+            continue
+        dst = (output_root / src.relative_to(input_root)).with_suffix(out_suffix)
+        up_to_date = dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime
+        jobs.append((src, dst, "skipped" if up_to_date and not force else "pending"))
+    # Biggest files first so the pool does not end waiting on one large state file
+    jobs.sort(key=lambda job: job[0].stat().st_size, reverse=True)
+    return jobs
+
+
+def read_manifest(path: Path) -> dict:
+    """Previous run's manifest rows by input path ({} if there is none)."""
+    if not path.exists():
+        return {}
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["input"]: row for row in csv.DictReader(f)}
+
+
+def convert_file(src: Path, dst: Path, to: str) -> dict:
+    """Worker task: convert one file into a temp name, then move it into place."""
+    t0 = time.time()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    partial = dst.with_name(dst.name + ".partial")  # never leave a half-written, "up to date" output behind
+    record = {"input": str(src), "output": str(dst), "input_bytes": src.stat().st_size}
+    try:
+        if to == "parquet":
+            rows = geojsonTOgeoparquet.convert(str(src), str(partial))
+        else:
+            rows = parquetTOgeojson.geoparquet_to_geojson(str(src), str(partial))
+        os.replace(partial, dst)
+        record.update(status="converted", rows=rows, output_bytes=dst.stat().st_size)
+    except Exception as e:
+        if partial.exists():
+            partial.unlink()
+        record.update(status="failed", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.time() - t0, 3)
+    return record
+
+
+def convert_tree(
+    input_root: str = INPUT_ROOT,
+    output_root: str = OUTPUT_ROOT,
+    to: str = TO,
+    workers: int = WORKERS,
+    force: bool = False,
+    include_json: bool = INCLUDE_JSON,
+):
+    input_root, output_root = Path(input_root), Path(output_root)
+    if not input_root.is_dir():
+        raise FileNotFoundError(f"Input root not found: {input_root}")
+    output_root.mkdir(parents=True, exist_ok=True)
+
+    t0 = time.time()
+    manifest = output_root / MANIFEST_NAME
+    previous = read_manifest(manifest)
+    jobs = plan(input_root, output_root, to, force, include_json)
+    pending = [(src, dst) for src, dst, status in jobs if status == "pending"]
+    # Up-to-date files keep the row count/timing of the run that converted them
+    records = [
+        {**previous.get(str(src), {}), "input": str(src), "output": str(dst), "status": "skipped",
+         "input_bytes": src.stat().st_size, "output_bytes": dst.stat().st_size}
+        for src, dst, status in jobs if status == "skipped"
+    ]
+    print(f"🗂️ {len(jobs)} files under {input_root}: {len(pending)} to convert, {len(records)} up to date")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert_file, src, dst, to): src for src, dst in pending}
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    record = future.result()
+                    records.append(record)
+                    name = Path(record["input"]).relative_to(input_root)
+                    if record["status"] == "converted":
+                        print(f"✅ [{done}/{len(pending)}] {name}: {record['rows']} rows in {record['seconds']:.1f}s")
+                    else:
+                        print(f"   ❌ [{done}/{len(pending)}] {name}: {record['error']}")
+            except KeyboardInterrupt:
+                print("\n🛑 Stopped by user; the manifest lists the files finished so far.")
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise  # after the manifest is written below; no "Completed" summary
+    finally:
+        with open(manifest, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(sorted(records, key=lambda r: r["input"]))
+
+    counts = {s: sum(r["status"] == s for r in records) for s in ("converted", "skipped", "failed")}
+    rows = sum(r["rows"] for r in records if r["status"] == "converted")
+    mb = sum(r["input_bytes"] for r in records if r["status"] == "converted") / 1e6
+    elapsed = time.time() - t0
+    print(f"\n✨ Completed in {elapsed:.1f}s: {counts['converted']} converted ({rows} rows, {mb:,.1f} MB, "
+          f"{mb / max(elapsed, 1e-9):,.1f} MB/s), {counts['skipped']} up to date, {counts['failed']} failed")
+    print(f"   manifest: {manifest}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Convert a directory tree between GeoJSON and GeoParquet in parallel.")
+    ap.add_argument("--input-root", default=INPUT_ROOT, help="Directory to walk")
+    ap.add_argument("--output-root", default=OUTPUT_ROOT, help="Mirrored output directory")
+    ap.add_argument("--to", choices=sorted(CONVERSIONS), default=TO, help="Target format")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Worker processes")
+    ap.add_argument("--force", action="store_true", help="Reconvert even when the output is newer than the input")
+    ap.add_argument("--include-json", action="store_true", default=INCLUDE_JSON,
+                    help="Also convert *.json files as GeoJSON (--to parquet)")
+    args = ap.parse_args()
+    try:
+        convert_tree(args.input_root, args.output_root, args.to, args.workers, args.force, args.include_json)
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -1,113 +1,87 @@
+import argparse
 import os
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
-import geopandas as gpd
-import pyarrow.parquet as pq
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
-from shapely import wkb
+
+import broadband as bb  # shared streaming loader: pipelined COPY, staging swap, filter pushdown
 
 # ───────── LOAD ENV FILE ─────────
 load_dotenv()
 DB_URL = os.getenv("DATABASE_URL_LOCAL")  # Use local for testing
 if not DB_URL:
-    raise ValueError("❌ DATABASE_URL not found in .env file")
+    raise ValueError("❌ DATABASE_URL_LOCAL not found in .env file")
 
 # ───────── CONFIGURATION ─────────
 INPUT_FILE     = r"D:\CIR\prefect_ELT\Con_Edison_Orange_and_Rockland_qgis.parquet"  # path to GeoParquet
 TABLE_NAME     = "distribution"
 SCHEMA         = "public"
-CHUNKSIZE      = 750_000   # rows per DB insert
 BATCHSIZE      = 1_000_000   # rows read from parquet at a time
+GEOM_COLUMN    = "geom"      # geometry column name in PostGIS
+
+# Load mode: "replace" = drop the table and COPY into it (indexes maintained during
+# the load); "staging" = COPY into an UNLOGGED, index-free staging table, build
+# indexes in parallel, ANALYZE, then swap it in atomically.
+LOAD_MODE           = "replace"
+INDEX_COLUMNS       = ["feeder_id", "substation", "owner_name"]  # btree indexes built after a staging load
+
+# Row filters pushed down to the parquet reader, e.g. {"owner_name": ["Orange and Rockland"]}.
+# Row groups whose statistics cannot match are never decoded. With filters set,
+# only the matching rows in the table are deleted and reloaded (no replace).
+FILTERS: Optional[Dict[str, Any]] = None
 
 # Only keep these columns + geometry. Set to None to keep all.
 SELECT_COLUMNS: Optional[List[str]] = [
     "id","feeder_id","substation","voltage_kv","hosting_capacity_kw","owner_name", "raw_data"
 ]
 
-# DB engine
-engine = create_engine(DB_URL)
-
-
-# ───────── Helpers ─────────
-def force_epsg4326(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    """Ensure EPSG:4326 for PostGIS upload."""
-    if gdf.crs is None:
-        gdf = gdf.set_crs(epsg=4326, allow_override=True)
-    elif gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
-
-
-def apply_select_columns(gdf: gpd.GeoDataFrame, selects: Optional[List[str]]) -> gpd.GeoDataFrame:
-    if not selects:
-        return gdf
-    keep = [c for c in selects if c in gdf.columns]
-    # Always keep geometry
-    if gdf.geometry.name not in keep:
-        keep.append(gdf.geometry.name)
-    return gdf[keep]
-
-
-from shapely import wkb
-
-def stream_parquet_batches(parquet_file: str, batch_size: int):
-    """Yield GeoDataFrames in batches directly from a big parquet file."""
-    pf = pq.ParquetFile(parquet_file)
-    for batch in pf.iter_batches(batch_size=batch_size):
-        df = batch.to_pandas()
-
-        # Detect geometry column automatically
-        if "geometry" not in df.columns:
-            raise ValueError("❌ No 'geometry' column found in parquet file")
-
-        # Decode WKB → Shapely
-        df["geom"] = df["geometry"].apply(lambda x: wkb.loads(x) if isinstance(x, (bytes, bytearray)) else x)
-        df = df.drop(columns=["geometry"])  # drop old WKB column
-
-        # Create GeoDataFrame with new 'geom' column
-        gdf = gpd.GeoDataFrame(df, geometry="geom", crs="EPSG:4326")
-        yield gdf
-
+# The loader lives in broadband.py; point it at this table and database.
+# The file's own types are kept (no broadband-specific compact dtypes); chunk
+# size, worker counts and index-build settings are broadband's.
+bb.configure(
+    db_url=DB_URL,
+    TABLE_NAME=TABLE_NAME, SCHEMA=SCHEMA, GEOM_COLUMN=GEOM_COLUMN, GEOMETRY_SOURCE="wkb", COMPACT_DTYPES=False,
+    SELECT_COLUMNS=SELECT_COLUMNS, INDEX_COLUMNS=INDEX_COLUMNS,
+)
 
 
 # ───────── Upload ─────────
-def upload_parquet_to_postgis(parquet_file: str, batch_size: int = BATCHSIZE):
-    if not os.path.exists(parquet_file):
-        raise FileNotFoundError(f"❌ Input file not found: {parquet_file}")
-
-    print(f"📂 Streaming from {parquet_file} in batches of {batch_size} rows...")
-    first = True
-    total_uploaded = 0
-
-    for gdf in stream_parquet_batches(parquet_file, batch_size):
-        if gdf.empty:
-            continue
-
-        # Normalize CRS and filter columns
-        gdf = force_epsg4326(gdf)
-        gdf = apply_select_columns(gdf, SELECT_COLUMNS)
-
-        # Upload this batch
-        print(f"📤 Uploading {len(gdf)} rows...")
-        gdf.to_postgis(
-            TABLE_NAME,
-            engine,
-            schema=SCHEMA,
-            if_exists="replace" if first else "append",
-            index=False,
-            chunksize=CHUNKSIZE,
-        )
-        total_uploaded += len(gdf)
-        first = False
-        print(f"✅ Uploaded {total_uploaded} rows so far...")
-
-    print(f"🎉 Done! Total uploaded: {total_uploaded} rows → {SCHEMA}.{TABLE_NAME}")
+def upload_parquet_to_postgis(
+    parquet_file: str,
+    batch_size: int = BATCHSIZE,
+    transform_workers: int = bb.TRANSFORM_WORKERS,
+    upload_workers: int = bb.UPLOAD_WORKERS,
+    max_in_flight: int = bb.MAX_IN_FLIGHT,
+    ordered: bool = bb.ORDERED_COMMIT,
+    filters: Optional[Dict[str, Any]] = FILTERS,
+    load_mode: str = LOAD_MODE,
+):
+    """Stream the distribution GeoParquet into PostGIS with broadband's pipelined COPY upload."""
+    if load_mode not in ("replace", "staging"):
+        raise ValueError(f"❌ LOAD_MODE must be 'replace' or 'staging', got {load_mode!r}")
+    bb.upload_parquet_to_postgis(
+        parquet_file, batch_size, transform_workers, upload_workers, max_in_flight, ordered, filters, load_mode
+    )
 
 
 # ───────── MAIN ─────────
 def main():
-    upload_parquet_to_postgis(INPUT_FILE, BATCHSIZE)
+    ap = argparse.ArgumentParser(description=f"Stream GeoParquet → PostGIS ({SCHEMA}.{TABLE_NAME}).")
+    ap.add_argument("--input", default=INPUT_FILE, help="Input GeoParquet file")
+    ap.add_argument("--batch-size", type=int, default=BATCHSIZE, help="Rows read from parquet at a time")
+    ap.add_argument(
+        "--filter", action="append", default=[], metavar="COLUMN=VALUE[,VALUE...]",
+        help="Only load (and replace) matching rows, e.g. --filter substation=Ramapo; repeat to AND filters",
+    )
+    ap.add_argument(
+        "--load-mode", choices=["replace", "staging"], default=LOAD_MODE,
+        help="replace = load the live table directly; staging = load, index and swap atomically",
+    )
+    args = ap.parse_args()
+
+    upload_parquet_to_postgis(
+        args.input, args.batch_size, filters=bb.parse_filters(args.filter) or FILTERS, load_mode=args.load_mode
+    )
 
 
 if __name__ == "__main__":
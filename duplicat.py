@@ -1,25 +1,150 @@
-import duckdb
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import argparse
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
 
 # Input and output files
 input_file = r"D:/CIR/prefect_ELT/roads_FULLNAME.parquet"
 output_file = r"D:/CIR/prefect_ELT/roads_FULLNAME_dedup.parquet"
+report_file = r"D:/CIR/prefect_ELT/roads_FULLNAME_duplicates.parquet"
 
-# Open a DuckDB connection (in-memory by default, but very efficient)
-con = duckdb.connect()
-
-# Register parquet file as a virtual table
-con.execute(f"""
-    CREATE VIEW parquet_data AS 
-    SELECT * FROM read_parquet('{input_file}')
-""")
-
-# Deduplicate rows based on geometry column
-# Replace 'geometry' with the actual geometry column name
-con.execute(f"""
-    COPY (
-        SELECT DISTINCT ON (geometry) *
-        FROM parquet_data
-    ) TO '{output_file}' (FORMAT PARQUET)
-""")
-
-print(f"Deduplicated file written to: {output_file}")
+GEOMETRY_COLUMN = "geometry"
+GRID_SIZE = 1e-7         # coordinates are snapped to this grid before hashing (1e-7° ≈ 1 cm)
+BUCKETS = 64             # on-disk hash buckets; each must fit in memory (≈ file size / BUCKETS)
+BATCH_SIZE = 200_000
+
+KEY_COLUMN = "_geom_key"
+ROW_COLUMN = "_row"
+
+
+def geometry_keys(wkb_values: pa.Array, grid_size: float = GRID_SIZE) -> pa.Array:
+    """
+    Canonical 16-byte key per geometry: snap to the grid, drop the repeated points
+    snapping creates, normalize (vertex order, ring start, line direction, part
+    order), then blake2b the WKB. Null/empty geometries get a null key.
+    """
+    geoms = shapely.from_wkb(wkb_values.to_numpy(zero_copy_only=False))
+    geoms = shapely.set_precision(geoms, grid_size, mode="pointwise")
+    geoms = shapely.normalize(shapely.remove_repeated_points(geoms))
+    missing = shapely.is_missing(geoms) | shapely.is_empty(geoms)
+    canonical = shapely.to_wkb(geoms)
+    keys = [None if m else hashlib.blake2b(w, digest_size=16).digest() for w, m in zip(canonical, missing)]
+    return pa.array(keys, pa.binary(16))
+
+
+def write_buckets(input_file: str, work_dir: str, grid_size: float, buckets: int, batch_size: int) -> int:
+    """Pass 1: key every row and spill it to the bucket its key hashes to."""
+    dataset = ds.dataset(input_file, format="parquet")
+    if GEOMETRY_COLUMN not in dataset.schema.names:
+        raise ValueError(f"❌ No '{GEOMETRY_COLUMN}' column in {input_file}")
+    schema = dataset.schema.remove_metadata().append(pa.field(KEY_COLUMN, pa.binary(16))).append(
+        pa.field(ROW_COLUMN, pa.int64())
+    )
+    writers = {}
+    rows = 0
+    t0 = time.time()
+    try:
+        for batch in dataset.to_batches(batch_size=batch_size):
+            keys = geometry_keys(batch.column(GEOMETRY_COLUMN), grid_size)
+            row_ids = pa.array(np.arange(rows, rows + batch.num_rows, dtype=np.int64))
+            table = pa.Table.from_batches([batch]).append_column(KEY_COLUMN, keys).append_column(ROW_COLUMN, row_ids)
+            # Bucket = first 8 key bytes as an integer (even for any bucket count);
+            # null keys (no geometry) all go to bucket 0 and are never dropped
+            prefix = np.frombuffer(keys.buffers()[1], dtype="<u8")[keys.offset * 2::2][:len(keys)]
+            bucket = np.where(keys.is_valid().to_numpy(zero_copy_only=False), prefix % np.uint64(buckets), 0)
+            order = np.argsort(bucket, kind="stable")
+            table, bucket = table.take(pa.array(order)), bucket[order]
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            for start, end in zip(starts, np.r_[starts[1:], len(bucket)]):
+                b = int(bucket[start])
+                if b not in writers:
+                    writers[b] = pq.ParquetWriter(os.path.join(work_dir, f"bucket_{b:04d}.parquet"), schema)
+                writers[b].write_table(table.slice(start, end - start).cast(schema))
+            rows += batch.num_rows
+            print(f"🔑 Keyed {rows} rows ({rows / (time.time() - t0):,.0f} rows/s)")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return rows
+
+
+def dedupe_bucket(path: str):
+    """Pass 2 for one bucket: keep the first row of every key, report the rest."""
+    table = pq.read_table(path)
+    keyed = table.filter(pc.is_valid(table[KEY_COLUMN]))
+    groups = keyed.group_by(KEY_COLUMN).aggregate([(ROW_COLUMN, "min"), (ROW_COLUMN, "list"), (ROW_COLUMN, "count")])
+    keep_rows = pc.is_in(table[ROW_COLUMN], value_set=groups[f"{ROW_COLUMN}_min"])
+    keep = pc.or_(keep_rows, pc.is_null(table[KEY_COLUMN]))
+    kept = table.filter(keep).sort_by(ROW_COLUMN)
+
+    dupes = groups.filter(pc.greater(groups[f"{ROW_COLUMN}_count"], 1))
+    report = pa.table({
+        "geom_key": dupes[KEY_COLUMN],
+        "copies": dupes[f"{ROW_COLUMN}_count"],
+        "kept_row": dupes[f"{ROW_COLUMN}_min"],
+        "rows": dupes[f"{ROW_COLUMN}_list"],
+    })
+    return kept.drop_columns([KEY_COLUMN, ROW_COLUMN]), report
+
+
+def dedupe(
+    input_file: str = input_file,
+    output_file: str = output_file,
+    report_file: str = report_file,
+    grid_size: float = GRID_SIZE,
+    buckets: int = BUCKETS,
+    batch_size: int = BATCH_SIZE,
+):
+    t0 = time.time()
+    in_schema = pq.read_schema(input_file)
+    work_dir = tempfile.mkdtemp(prefix="dedupe_", dir=os.path.dirname(os.path.abspath(output_file)))
+    out_writer = report_writer = None
+    rows_out = groups = dropped = 0
+    try:
+        rows_in = write_buckets(input_file, work_dir, grid_size, buckets, batch_size)
+        out_writer = pq.ParquetWriter(output_file, in_schema)  # keeps the input's GeoParquet metadata
+        for name in sorted(os.listdir(work_dir)):
+            kept, report = dedupe_bucket(os.path.join(work_dir, name))
+            out_writer.write_table(kept.cast(in_schema))
+            if report.num_rows:
+                if report_writer is None:
+                    report_writer = pq.ParquetWriter(report_file, report.schema)
+                report_writer.write_table(report)
+            rows_out += kept.num_rows
+            groups += report.num_rows
+            dropped += pc.sum(report["copies"]).as_py() - report.num_rows if report.num_rows else 0
+    finally:
+        if out_writer is not None:
+            out_writer.close()
+        if report_writer is not None:
+            report_writer.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"Deduplicated file written to: {output_file}")
+    print(f"   {rows_in} rows → {rows_out} rows: {dropped} duplicates in {groups} groups "
+          f"(grid {grid_size}, {time.time() - t0:.1f}s)")
+    if groups:
+        print(f"   duplicate report: {report_file}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Drop rows whose geometry duplicates an earlier row (order/direction-insensitive).")
+    ap.add_argument("--input", default=input_file, help="Input GeoParquet")
+    ap.add_argument("--output", default=output_file, help="Deduplicated GeoParquet")
+    ap.add_argument("--report", default=report_file, help="Parquet report of duplicate groups")
+    ap.add_argument("--grid-size", type=float, default=GRID_SIZE, help="Coordinate snapping grid (CRS units)")
+    ap.add_argument("--buckets", type=int, default=BUCKETS, help="On-disk hash buckets (raise for bigger files)")
+    args = ap.parse_args()
+    dedupe(args.input, args.output, args.report, args.grid_size, args.buckets)
+
+
+if __name__ == "__main__":
+    main()
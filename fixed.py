@@ -1,41 +1,108 @@
+import os
+import csv
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import geopandas as gpd
+import numpy as np
+import shapely
 from pathlib import Path
 
 INPUT_ROOT = r"D:\CIR\state"
-OUTPUT_ROOT = r"D:\CIR\state_geoparquet"
-
-def fix_and_convert():
-    input_root = Path(INPUT_ROOT)
-    output_root = Path(OUTPUT_ROOT)
-    output_root.mkdir(parents=True, exist_ok=True)
-    
-    total_files = 0
-    success_count = 0
-
-    for geojson_path in input_root.rglob("*.geojson"):
-        total_files += 1
-        try:
-            print(f"🔧 Processing: {geojson_path.relative_to(input_root)}")
-            
+REPORT_FILE = r"D:\CIR\state_validation.csv"  # one row per file; None = console only
+WORKERS = os.cpu_count() or 4
+
+
+def invalid_reasons(geoms: np.ndarray) -> Counter:
+    """'Self-intersection[-157.8 21.3]' → 'Self-intersection', counted."""
+    return Counter(reason.split("[", 1)[0] for reason in shapely.is_valid_reason(geoms))
+
+
+def format_reasons(reasons: dict) -> str:
+    return "; ".join(f"{reason}: {n}" for reason, n in Counter(reasons).most_common())
+
+
+def fix_file(geojson_path: Path) -> dict:
+    """
+    Worker task: check every geometry with one vectorized is_valid call and only
+    when something is invalid re-read the full file, make_valid() those rows and
+    swap the result in atomically. Valid files are never rewritten.
+    """
+    t0 = time.time()
+    result = {"file": str(geojson_path), "features": 0, "invalid": 0, "reasons": {}, "rewritten": False, "error": ""}
+    try:
+        geoms = gpd.read_file(geojson_path, columns=[]).geometry.values.to_numpy()  # geometry only
+        result["features"] = len(geoms)
+        invalid = ~shapely.is_valid(geoms) & ~shapely.is_missing(geoms)
+        result["invalid"] = int(invalid.sum())
+        if invalid.any():
+            result["reasons"] = dict(invalid_reasons(geoms[invalid]))
+
             gdf = gpd.read_file(geojson_path)
-            if gdf.empty:
-                print("   ⚠️ Skipping empty file")
-                continue
+            fixed = gdf.geometry.values.to_numpy().copy()
+            fixed[invalid] = shapely.make_valid(fixed[invalid])
+            gdf = gdf.set_geometry(gpd.GeoSeries(fixed, index=gdf.index, crs=gdf.crs))
+
+            # Write next to the source and swap: an interrupted run leaves the original intact
+            tmp_path = geojson_path.with_name(geojson_path.name + ".tmp")
+            try:
+                gdf.to_file(tmp_path, driver="GeoJSON")
+                os.replace(tmp_path, geojson_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            result["rewritten"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.time() - t0, 3)
+    return result
+
+
+def validate_tree(input_root: str = INPUT_ROOT, report_file: str = REPORT_FILE, workers: int = WORKERS):
+    input_root = Path(input_root)
+    # Biggest files first so the pool does not end waiting on one large file
+    files = sorted(input_root.rglob("*.geojson"), key=lambda p: p.stat().st_size, reverse=True)
+    print(f"🔧 Validating {len(files)} GeoJSON files under {input_root} with {workers} workers...")
 
-            # ✅ CORRECT: Call make_valid() on the GeoDataFrame
-            gdf_fixed = gdf.make_valid()
+    results = []
+    totals = Counter()
+    t0 = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(fix_file, path): path for path in files}
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    result = future.result()
+                    results.append(result)
+                    name = Path(result["file"]).relative_to(input_root)
+                    if result["error"]:
+                        print(f"   ❌ [{done}/{len(files)}] ERROR in {name}: {result['error']}")
+                    elif result["rewritten"]:
+                        print(f"✅ [{done}/{len(files)}] {name}: fixed {result['invalid']}/{result['features']} "
+                              f"({format_reasons(result['reasons'])})")
+                        totals.update(result["reasons"])
+                    else:
+                        print(f"   [{done}/{len(files)}] {name}: all {result['features']} valid")
+            except KeyboardInterrupt:
+                print("\n🛑 Stopped by user.")
+                pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        if report_file and results:
+            with open(report_file, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=list(results[0]))
+                writer.writeheader()
+                for r in sorted(results, key=lambda r: r["file"]):
+                    writer.writerow({**r, "reasons": format_reasons(r["reasons"])})
 
-            gdf_fixed.to_file(geojson_path, driver="GeoJSON")
-            print(f"✅ Saved {geojson_path}")
-            success_count += 1
-            
-        except KeyboardInterrupt:
-            print("\n🛑 Stopped by user.")
-            break
-        except Exception as e:
-            print(f"   ❌ ERROR in {geojson_path.name}: {e}")
+    rewritten = sum(r["rewritten"] for r in results)
+    failed = sum(bool(r["error"]) for r in results)
+    print(f"\n✨ Completed in {time.time() - t0:.1f}s! {len(results)}/{len(files)} files checked, "
+          f"{rewritten} rewritten, {len(results) - rewritten - failed} already valid, {failed} failed.")
+    for reason, n in totals.most_common():
+        print(f"   {reason}: {n}")
+    if report_file and results:
+        print(f"   report: {report_file}")
 
-    print(f"\n✨ Completed! {success_count}/{total_files} files processed.")
 
 if __name__ == "__main__":
-    fix_and_convert()
+    validate_tree()
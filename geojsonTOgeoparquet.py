@@ -1,47 +1,186 @@
-import fiona
+import os
+import json
+import time
+import argparse
+from contextlib import contextmanager
 import pyarrow as pa
 import pyarrow.parquet as pq
 import pyproj
-from shapely.geometry import shape, mapping
-import shapely.wkb as swkb
+
+try:
+    from pyogrio.raw import open_arrow  # GDAL → Arrow record batches, no per-feature Python objects
+except ImportError:
+    open_arrow = None
 
 input_file = r"D:\CIR\prefect_ELT\Secondary_Roads_Interstates_and_US_Highways.geojson"
 output_file = r"D:\CIR\prefect_ELT\Secondary_Roads_Interstates_and_US_Highways.parquet"
 
-# Open GeoJSON in streaming mode
-with fiona.open(input_file, "r") as src:
-    schema = src.schema
-    crs = src.crs
+batch_size = 50000  # features per Arrow batch; memory use is bounded by this, not by the file size
+GEOMETRY_COLUMN = "geometry"
+
+# OGR layer geometry type → GeoParquet geometry_types entry ("Unknown" → [] = any type)
+GEOMETRY_TYPES = {
+    "Point": "Point", "LineString": "LineString", "Polygon": "Polygon",
+    "MultiPoint": "MultiPoint", "MultiLineString": "MultiLineString", "MultiPolygon": "MultiPolygon",
+    "GeometryCollection": "GeometryCollection",
+}
+
+
+# ───────── READ ─────────
+@contextmanager
+def open_source(path: str, batch_size: int):
+    """Yield (crs, geometry type, iterator of RecordBatches with WKB in GEOMETRY_COLUMN)."""
+    if open_arrow is not None:
+        with open_arrow(path, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+            source_geom = meta["geometry_name"] or "wkb_geometry"
+
+            def batches():
+                for batch in reader:
+                    names = [GEOMETRY_COLUMN if n == source_geom else n for n in batch.schema.names]
+                    yield batch.rename_columns(names)
+
+            yield meta["crs"], meta["geometry_type"], batches()
+        return
+
+    # Fallback without pyogrio: Fiona feature dicts, converted batch by batch
+    import fiona
+    from shapely.geometry import shape
+
+    def to_batch(rows):
+        names = list(dict.fromkeys(k for row in rows for k in row))  # every property seen in the batch
+        return pa.RecordBatch.from_pydict({n: [row.get(n) for row in rows] for n in names})
+
+    with fiona.open(path, "r") as src:
+        def batches():
+            rows = []
+            for feat in src:
+                geom = feat["geometry"]
+                rows.append({**feat["properties"], GEOMETRY_COLUMN: shape(geom).wkb if geom else None})
+                if len(rows) >= batch_size:
+                    yield to_batch(rows)
+                    rows = []
+            if rows:
+                yield to_batch(rows)
+
+        yield src.crs_wkt or None, src.schema.get("geometry", "Unknown"), batches()
+
+
+# ───────── SCHEMA UNIFICATION ─────────
+def unify_types(a: pa.DataType, b: pa.DataType) -> pa.DataType:
+    """Common type for a property seen as `a` in one batch and `b` in another."""
+    if a == b:
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_null(b):
+        return a
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        return pa.int64()
+    if (pa.types.is_integer(a) or pa.types.is_floating(a)) and (pa.types.is_integer(b) or pa.types.is_floating(b)):
+        return pa.float64()
+    return pa.string()  # anything else (e.g. number in one feature, text in another) → text
+
+
+def unify_schemas(a: pa.Schema, b: pa.Schema) -> pa.Schema:
+    """Fields of `a` then new fields of `b`, each with a type both can be cast to."""
+    fields = {f.name: f.type for f in a}
+    for f in b:
+        fields[f.name] = unify_types(fields[f.name], f.type) if f.name in fields else f.type
+    return pa.schema(list(fields.items()), metadata=a.metadata)
+
+
+def fits(batch: pa.RecordBatch, schema: pa.Schema) -> bool:
+    """True if the batch can be written under `schema` (missing or all-null columns are fine)."""
+    for f in batch.schema:
+        i = schema.get_field_index(f.name)
+        if i < 0 or not (f.type == schema.field(i).type or pa.types.is_null(f.type)):
+            return False
+    return True
+
+
+def conform(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    """Reorder/cast the batch's columns to `schema`, filling absent properties with nulls."""
+    arrays = []
+    for f in schema:
+        i = batch.schema.get_field_index(f.name)
+        arrays.append(batch.column(i).cast(f.type) if i >= 0 else pa.nulls(batch.num_rows, f.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
 
-    # Convert CRS to EPSG if needed
-    epsg = None
-    if crs and "init" in crs:
-        epsg = crs["init"].upper().replace("EPSG:", "")
 
-    batch_size = 50000  # adjust depending on memory
-    features = []
-    table_batches = []
+# ───────── GEOPARQUET ─────────
+def geo_metadata(crs, geometry_type: str) -> dict:
+    """GeoParquet 1.0 metadata with the source CRS as PROJJSON."""
+    column_meta = {"encoding": "WKB", "geometry_types": []}
+    name = geometry_type or ""
+    has_z = name.startswith("3D ") or name.endswith(" Z")  # Fiona: "3D LineString", pyogrio: "LineString Z"
+    kind = GEOMETRY_TYPES.get(name.replace("3D ", "").replace(" Z", ""))
+    if kind:
+        column_meta["geometry_types"] = [kind + (" Z" if has_z else "")]
+    if crs:
+        column_meta["crs"] = pyproj.CRS.from_user_input(crs).to_json_dict()
+    geo = {"version": "1.0.0", "primary_column": GEOMETRY_COLUMN, "columns": {GEOMETRY_COLUMN: column_meta}}
+    return {b"geo": json.dumps(geo).encode("utf-8")}
 
-    for i, feat in enumerate(src):
-        geom = shape(feat["geometry"])
-        # store geometry as WKB (compact binary form)
-        geom_wkb = swkb.dumps(geom)
 
-        row = {**feat["properties"], "geometry": geom_wkb}
-        features.append(row)
+# ───────── CONVERT ─────────
+def convert(input_file: str = input_file, output_file: str = output_file, batch_size: int = batch_size):
+    """
+    Stream GeoJSON → GeoParquet one batch at a time. Batches go straight to a
+    ParquetWriter; when a batch adds a property or changes a type that cannot be
+    cast into the current schema, a new part file is started under the unified
+    schema, and the parts are streamed into the output under the final schema.
+    """
+    t0 = time.time()
+    parts = []
+    writer = schema = None
+    rows = 0
+    try:
+        with open_source(input_file, batch_size) as (crs, geometry_type, batches):
+            metadata = geo_metadata(crs, geometry_type)
+            for batch in batches:
+                if schema is None or not fits(batch, schema):
+                    schema = (batch.schema if schema is None else unify_schemas(schema, batch.schema))
+                    schema = schema.with_metadata(metadata)
+                    if writer is not None:
+                        writer.close()
+                        print(f"🔀 Schema changed at feature {rows}; continuing in part {len(parts) + 1}")
+                    parts.append(f"{output_file}.part{len(parts)}")
+                    writer = pq.ParquetWriter(parts[-1], schema)
+                writer.write_batch(conform(batch, schema))
+                rows += batch.num_rows
+                print(f"📦 Written {rows} features ({rows / (time.time() - t0):,.0f} features/s)")
+        if writer is not None:
+            writer.close()
+            writer = None
 
-        if len(features) >= batch_size:
-            # Convert to Arrow Table
-            batch = pa.Table.from_pylist(features)
-            table_batches.append(batch)
-            features = []
+        if not parts:
+            raise ValueError(f"❌ No features in {input_file}")
+        if len(parts) == 1:
+            os.replace(parts[0], output_file)
+        else:
+            # Later parts' schemas already include the earlier ones, so the last one is final
+            writer = pq.ParquetWriter(output_file, schema)
+            for part in parts:
+                for batch in pq.ParquetFile(part).iter_batches(batch_size=batch_size):
+                    writer.write_batch(conform(batch, schema))
+            writer.close()
+            writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
 
-    # Last batch
-    if features:
-        batch = pa.Table.from_pylist(features)
-        table_batches.append(batch)
+    print(f"✅ Saved GeoParquet: {output_file} ({rows} features, {len(schema) - 1} properties, "
+          f"{time.time() - t0:.1f}s)")
+    return rows
 
-# Write all batches into a single parquet file
-pq.write_table(pa.concat_tables(table_batches), output_file)
 
-print(f"✅ Saved GeoParquet: {output_file}")
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stream a GeoJSON file into GeoParquet.")
+    ap.add_argument("--input", default=input_file, help="Input GeoJSON")
+    ap.add_argument("--output", default=output_file, help="Output GeoParquet")
+    ap.add_argument("--batch-size", type=int, default=batch_size, help="Features per batch")
+    args = ap.parse_args()
+    convert(args.input, args.output, args.batch_size)
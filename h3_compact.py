@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Compact per-group H3 cell sets into mixed-resolution coverage and write GeoParquet.
+
+- Input:  Parquet file (or dataset directory) with an H3 column (e.g. 'h3_res8_id')
+          and grouping columns (e.g. provider_id, technology)
+- Output: GeoParquet with one row per compacted cell (h3, resolution, Polygon), or
+          with --dissolve one MultiPolygon per group; plus a 'bbox' covering column
+
+Usage:
+  python h3_compact.py \
+      --input /path/to/broadband.parquet \
+      --output /path/to/provider_coverage.geoparquet \
+      --h3-col h3_res8_id \
+      --group-cols provider_id technology \
+      --dissolve \
+      --workers 8
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+import h3  # python-h3 (v3 API)
+
+from H3TOgeom import BBOX_COLUMN, BBOX_TYPE, h3_to_wkb
+
+COMPACT_ROWS = 5_000_000  # re-deduplicate collected (group, cell) pairs beyond this many rows
+
+
+def collect_cells(input_path: str, h3_col: str, group_cols: List[str], batch_size: int) -> pa.Table:
+    """Single streaming pass → unique (group..., cell) pairs, deduplicated per batch with Arrow group_by."""
+    dataset = ds.dataset(input_path, format="parquet")
+    missing = [c for c in [h3_col] + group_cols if c not in dataset.schema.names]
+    if missing:
+        raise ValueError(f"Input columns {missing} not found. Available: {dataset.schema.names}")
+
+    keys = group_cols + [h3_col]
+    parts: List[pa.Table] = []
+    pending = rows = 0
+    threshold = COMPACT_ROWS
+    for batch in dataset.to_batches(columns=keys, batch_size=batch_size):
+        table = pa.Table.from_batches([batch])
+        table = table.filter(table[h3_col].is_valid())
+        parts.append(table.group_by(keys).aggregate([]))
+        pending += parts[-1].num_rows
+        rows += batch.num_rows
+        if pending > threshold:
+            parts = [pa.concat_tables(parts).group_by(keys).aggregate([])]
+            pending = parts[0].num_rows
+            threshold = max(COMPACT_ROWS, 2 * pending)  # don't re-deduplicate everything on every batch
+        print(f"[info] read ~{rows:,} rows, {pending:,} (group, cell) pairs...", file=sys.stderr)
+    if not parts:
+        raise ValueError("No H3 cells found")
+    return pa.concat_tables(parts).group_by(keys).aggregate([])
+
+
+def compact_cells(cells: List[str]) -> List[str]:
+    """Worker task: one group's cells → mixed-resolution compacted cells."""
+    return sorted(h3.compact(cells))
+
+
+def dissolve_cells(cells: List[str]) -> Tuple[bytes, int]:
+    """Worker task: one group's cells → (MultiPolygon WKB, compacted cell count)."""
+    loops = h3.h3_set_to_multi_polygon(cells, geo_json=True)  # [[outer, *holes], ...] as closed (lng, lat) loops
+    geom = shapely.MultiPolygon([(polygon[0], polygon[1:]) for polygon in loops])
+    return shapely.to_wkb(geom), len(h3.compact(cells))
+
+
+def bbox_array(geometry: pa.Array) -> pa.Array:
+    geoms = shapely.from_wkb(geometry.to_numpy(zero_copy_only=False))
+    missing = shapely.is_missing(geoms) | shapely.is_empty(geoms)  # null bbox, not NaN, so row-group stats stay usable
+    bounds = shapely.bounds(geoms)
+    return pa.StructArray.from_arrays(
+        [pa.array(bounds[:, i], mask=missing) for i in range(4)], fields=list(BBOX_TYPE), mask=pa.array(missing)
+    )
+
+
+def build_geo_metadata(geom_col: str, geometry_type: str) -> dict:
+    geo = {
+        "version": "1.1.0",
+        "primary_column": geom_col,
+        "columns": {
+            geom_col: {
+                "encoding": "WKB",
+                "geometry_types": [geometry_type],
+                "edges": "spherical",  # H3 cell edges are great-circle arcs
+                "covering": {"bbox": {key: [BBOX_COLUMN, key] for key in ("xmin", "ymin", "xmax", "ymax")}},
+            }
+        },
+    }
+    return {b"geo": json.dumps(geo).encode("utf-8")}
+
+
+def process(
+    input_path: str,
+    output_path: str,
+    h3_col: str,
+    group_cols: List[str],
+    geom_col: str,
+    batch_size: int,
+    dissolve: bool = False,
+    workers: int = 0,
+):
+    t0 = time.time()
+    pairs = collect_cells(input_path, h3_col, group_cols, batch_size)
+    grouped = pairs.group_by(group_cols).aggregate([(h3_col, "list")]).sort_by([(c, "ascending") for c in group_cols])
+    cell_lists = grouped[f"{h3_col}_list"].to_pylist()
+    print(f"[info] {pairs.num_rows:,} cells in {grouped.num_rows:,} groups ({time.time() - t0:.1f}s)", file=sys.stderr)
+
+    task = dissolve_cells if dissolve else compact_cells
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(task, cell_lists, chunksize=max(1, len(cell_lists) // (workers * 16))))
+    else:
+        results = [task(cells) for cells in cell_lists]
+
+    groups = grouped.select(group_cols)
+    if dissolve:
+        geometry = pa.array([wkb for wkb, _ in results], type=pa.binary())
+        table = groups.append_column("cell_count", pa.array([len(c) for c in cell_lists], pa.int64()))
+        table = table.append_column("compact_cell_count", pa.array([n for _, n in results], pa.int64()))
+        out_rows, geometry_type = table.num_rows, "MultiPolygon"
+    else:
+        counts = np.array([len(cells) for cells in results])
+        table = groups.take(pa.array(np.repeat(np.arange(groups.num_rows), counts)))
+        cells = [c for cells in results for c in cells]
+        table = table.append_column("h3", pa.array(cells, pa.string()))
+        table = table.append_column("resolution", pa.array([h3.h3_get_resolution(c) for c in cells], pa.int8()))
+        geometry = pa.array([h3_to_wkb(c) for c in cells], type=pa.binary())
+        out_rows, geometry_type = table.num_rows, "Polygon"
+
+    table = table.append_column(geom_col, geometry).append_column(BBOX_COLUMN, bbox_array(geometry))
+    table = table.replace_schema_metadata(build_geo_metadata(geom_col, geometry_type))
+    pq.write_table(table, output_path, compression="zstd")
+
+    print(f"[done] wrote GeoParquet: {output_path}")
+    print(f"[rows] {pairs.num_rows:,} input cells → {out_rows:,} {geometry_type} rows "
+          f"({pairs.num_rows / max(out_rows, 1):,.1f}x fewer, {time.time() - t0:.1f}s)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compact per-group H3 coverage into mixed-resolution GeoParquet.")
+    ap.add_argument("--input", required=True, help="Input Parquet file or directory")
+    ap.add_argument("--output", required=True, help="Output GeoParquet file")
+    ap.add_argument("--h3-col", default="h3_res8_id", help="Name of the H3 index column")
+    ap.add_argument("--group-cols", nargs="+", default=["provider_id", "technology"], help="Grouping key columns")
+    ap.add_argument("--geom-col", default="geometry", help="Name of the output geometry column")
+    ap.add_argument("--batch-size", type=int, default=1_000_000, help="Rows per batch (tune for RAM/CPU)")
+    ap.add_argument("--dissolve", action="store_true", help="One MultiPolygon per group instead of one row per cell")
+    ap.add_argument("--workers", type=int, default=0, help="Compact groups in N processes (0 = in this process)")
+    args = ap.parse_args()
+
+    process(
+        input_path=args.input,
+        output_path=args.output,
+        h3_col=args.h3_col,
+        group_cols=args.group_cols,
+        geom_col=args.geom_col,
+        batch_size=args.batch_size,
+        dissolve=args.dissolve,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Assign H3 cell coverage to GeoParquet features and write a (feature_id, h3) bridge table.
+
+- Polygons: cells whose centers fall inside the polygon (h3 polyfill); features
+  smaller than a cell get the cell of their representative point
+- Lines:    the vertex cells plus the H3 grid path (h3_line) between consecutive ones
+- Points:   the containing cell
+
+The bridge has one row per (feature, cell) with the cell as an unsigned 64-bit H3
+index, so cross-dataset questions become integer equi-joins on `h3` (and
+`h3_res8_id` in broadband converts with h3.string_to_h3).
+
+Usage:
+  python h3_polyfill.py \
+      --input /path/to/roads.parquet \
+      --output /path/to/roads_h3.parquet \
+      --id-col LINEARID \
+      --resolution 8 \
+      --workers 8
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import mapping
+from pyproj import CRS, Transformer
+import h3  # python-h3 (v3 API)
+
+METERS_PER_DEGREE = 111_320.0
+# shapely type ids after exploding multi-part geometries
+POINT_TYPES = (0,)
+LINE_TYPES = (1, 2)
+POLYGON_TYPES = (3,)
+
+
+def read_geo_metadata(path: str, geom_col: str) -> dict:
+    """GeoParquet column metadata for `geom_col` ({} if the file has none)."""
+    metadata = pq.read_schema(path).metadata or {}
+    if b"geo" not in metadata:
+        return {}
+    return json.loads(metadata[b"geo"]).get("columns", {}).get(geom_col, {})
+
+
+def to_lonlat(geoms: np.ndarray, crs) -> np.ndarray:
+    """Reproject to lon/lat WGS84 unless the GeoParquet CRS already is (or defaults to) it."""
+    if crs is None:
+        return geoms  # spec default is OGC:CRS84
+    crs = CRS.from_user_input(crs)
+    if crs.to_epsg() == 4326 or crs.equals("OGC:CRS84", ignore_axis_order=True):
+        return geoms
+    transformer = Transformer.from_crs(crs, 4326, always_xy=True)
+    return shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+
+
+def coords_to_cells(coords: np.ndarray, resolution: int) -> np.ndarray:
+    """(lon, lat) rows → uint64 H3 cells; one h3 call per distinct coordinate."""
+    if not len(coords):
+        return np.empty(0, dtype=np.uint64)
+    unique, inverse = np.unique(coords, axis=0, return_inverse=True)  # shared/repeated vertices, closed rings
+    cells = np.fromiter(
+        (h3.string_to_h3(h3.geo_to_h3(lat, lon, resolution)) for lon, lat in unique),
+        dtype=np.uint64,
+        count=len(unique),
+    )
+    return cells[inverse.ravel()]
+
+
+def segment_cells(a: int, b: int, start: np.ndarray, end: np.ndarray, resolution: int) -> np.ndarray:
+    """Cells between two vertex cells (both included): their grid path, or samples along the segment."""
+    try:
+        return np.array([h3.string_to_h3(c) for c in h3.h3_line(h3.h3_to_string(a), h3.h3_to_string(b))],
+                        dtype=np.uint64)
+    except ValueError:  # no grid path (crosses a pentagon's distortion): densify to half a cell edge instead
+        spacing = h3.edge_length(resolution, unit="m") / 2 / METERS_PER_DEGREE
+        segment = shapely.segmentize(shapely.linestrings([start, end]), spacing)
+        return coords_to_cells(shapely.get_coordinates(segment), resolution)
+
+
+def polygon_cells(polygon, resolution: int) -> List[int]:
+    cells = h3.polyfill(mapping(polygon), resolution, geo_json_conformant=True)
+    if not cells:  # smaller than a cell (parcels, small lots): fall back to one representative cell
+        point = polygon.representative_point()
+        return [h3.string_to_h3(h3.geo_to_h3(point.y, point.x, resolution))]
+    return [h3.string_to_h3(c) for c in cells]
+
+
+def cover(geoms: np.ndarray, feature_ids: pa.Array, resolution: int) -> pa.Table:
+    """Geometries → unique (feature_id, h3) pairs."""
+    parts, owner = shapely.get_parts(geoms, return_index=True)
+    types = shapely.get_type_id(parts)
+    idx_chunks: List[np.ndarray] = []
+    cell_chunks: List[np.ndarray] = []
+
+    # Points and lines: vertices → cells, all in one coordinate array
+    linear = np.isin(types, POINT_TYPES + LINE_TYPES)
+    if linear.any():
+        coords, which = shapely.get_coordinates(parts[linear], return_index=True)
+        features = owner[linear][which]
+        cells = coords_to_cells(coords, resolution)
+        idx_chunks.append(features)
+        cell_chunks.append(cells)
+
+        # Consecutive vertices of one line in different cells: trace the cells in between,
+        # one h3_line per distinct (from, to) cell pair
+        steps = np.flatnonzero((which[1:] == which[:-1]) & (cells[1:] != cells[:-1]))
+        if len(steps):
+            pairs, first, pair_of = np.unique(
+                np.column_stack([cells[steps], cells[steps + 1]]), axis=0, return_index=True, return_inverse=True
+            )
+            pair_of = pair_of.ravel()
+            traced = [segment_cells(int(a), int(b), coords[steps[f]], coords[steps[f] + 1], resolution)
+                      for (a, b), f in zip(pairs, first)]
+            lengths = np.array([len(t) for t in traced])
+            offsets = np.cumsum(lengths) - lengths
+            counts = lengths[pair_of]
+            # Gather each step's traced cells from the flat array: its pair's offset + 0..length-1
+            positions = np.repeat(offsets[pair_of] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+            idx_chunks.append(np.repeat(features[steps], counts))
+            cell_chunks.append(np.concatenate(traced)[positions])
+
+    # Polygons: polyfill per polygon
+    for i in np.flatnonzero(np.isin(types, POLYGON_TYPES)):
+        cells = polygon_cells(parts[i], resolution)
+        idx_chunks.append(np.full(len(cells), owner[i]))
+        cell_chunks.append(np.array(cells, dtype=np.uint64))
+
+    if not idx_chunks:
+        return pa.table({"feature_id": feature_ids.take(pa.array([], pa.int64())), "h3": pa.array([], pa.uint64())})
+    rows = np.concatenate(idx_chunks).astype(np.int64)
+    pairs = pa.table({"feature_id": feature_ids.take(pa.array(rows)), "h3": np.concatenate(cell_chunks)})
+    return pairs.group_by(["feature_id", "h3"], use_threads=False).aggregate([])
+
+
+def cover_row_groups(
+    path: str,
+    first_row: int,
+    row_groups: List[int],
+    id_col: Optional[str],
+    geom_col: str,
+    resolution: int,
+) -> Tuple[pa.Table, int]:
+    """Worker task: read a row-group range, cover its features, return (bridge rows, features read)."""
+    columns = [geom_col] + ([id_col] if id_col else [])
+    table = pq.ParquetFile(path).read_row_groups(row_groups, columns=columns)
+    if id_col:
+        feature_ids = table.column(id_col).combine_chunks()
+    else:
+        feature_ids = pa.array(np.arange(first_row, first_row + table.num_rows, dtype=np.int64))
+
+    geoms = shapely.from_wkb(table.column(geom_col).to_numpy(zero_copy_only=False))
+    geoms = to_lonlat(geoms, read_geo_metadata(path, geom_col).get("crs"))
+    return cover(geoms, feature_ids, resolution), table.num_rows
+
+
+def plan_tasks(path: str, per_task: int) -> List[Tuple[int, List[int]]]:
+    """Split the file into (first_row, row_groups) ranges of `per_task` row groups."""
+    metadata = pq.ParquetFile(path).metadata
+    tasks, first_row = [], 0
+    for start in range(0, metadata.num_row_groups, per_task):
+        groups = list(range(start, min(start + per_task, metadata.num_row_groups)))
+        tasks.append((first_row, groups))
+        first_row += sum(metadata.row_group(g).num_rows for g in groups)
+    return tasks
+
+
+def process(
+    input_path: str,
+    output_path: str,
+    id_col: Optional[str],
+    geom_col: str,
+    resolution: int,
+    workers: int = 0,
+    per_task: int = 1,
+):
+    schema = pq.read_schema(input_path)
+    for col in [geom_col] + ([id_col] if id_col else []):
+        if col not in schema.names:
+            raise ValueError(f"Input column '{col}' not found. Available: {schema.names}")
+    encoding = read_geo_metadata(input_path, geom_col).get("encoding", "WKB")
+    if encoding.upper() != "WKB":
+        raise ValueError(f"Unsupported GeoParquet geometry encoding: {encoding}")
+
+    id_type = schema.field(id_col).type if id_col else pa.int64()
+    if pa.types.is_dictionary(id_type):
+        id_type = id_type.value_type
+    out_schema = pa.schema([("feature_id", id_type), ("h3", pa.uint64())]).with_metadata(
+        {"h3_resolution": str(resolution), "source": input_path}
+    )
+    writer = pq.ParquetWriter(output_path, out_schema, compression="zstd")
+
+    tasks = plan_tasks(input_path, per_task)
+    features = pairs = 0
+    t0 = time.time()
+
+    def write(result: Tuple[pa.Table, int]):
+        nonlocal features, pairs
+        bridge, n = result
+        writer.write_table(bridge.select(["feature_id", "h3"]).cast(out_schema))
+        features += n
+        pairs += bridge.num_rows
+        print(f"[info] {features:,} features → {pairs:,} cells ({features / (time.time() - t0):,.0f} features/s)",
+              file=sys.stderr)
+
+    try:
+        if workers <= 1:
+            for first_row, groups in tasks:
+                write(cover_row_groups(input_path, first_row, groups, id_col, geom_col, resolution))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(cover_row_groups, input_path, first_row, groups, id_col, geom_col, resolution)
+                    for first_row, groups in tasks
+                ]
+                try:
+                    for future in as_completed(futures):
+                        write(future.result())
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+    finally:
+        writer.close()
+
+    print(f"[done] wrote bridge table: {output_path}")
+    print(f"[rows] {features:,} features → {pairs:,} (feature_id, h3) rows at res {resolution} "
+          f"({pairs / max(features, 1):.1f} cells/feature, {time.time() - t0:.1f}s)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write a (feature_id, h3) bridge table for GeoParquet geometries.")
+    ap.add_argument("--input", required=True, help="Input GeoParquet file")
+    ap.add_argument("--output", required=True, help="Output bridge Parquet file")
+    ap.add_argument("--id-col", default=None, help="Feature id column (default: row number)")
+    ap.add_argument("--geom-col", default="geometry", help="Name of the WKB geometry column")
+    ap.add_argument("--resolution", type=int, default=8, help="H3 resolution of the cells")
+    ap.add_argument("--workers", type=int, default=0, help="Cover row groups in N processes (0 = in this process)")
+    ap.add_argument("--row-groups-per-task", type=int, default=1, help="Row groups handed to a worker at a time")
+    args = ap.parse_args()
+
+    process(
+        input_path=args.input,
+        output_path=args.output,
+        id_col=args.id_col,
+        geom_col=args.geom_col,
+        resolution=args.resolution,
+        workers=args.workers,
+        per_task=args.row_groups_per_task,
+    )
+
+
+if __name__ == "__main__":
+    main()
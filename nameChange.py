@@ -1,16 +1,163 @@
-import pandas as pd
+import json
+import time
+import argparse
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # Input and output file paths
-input_file = "D:\CIR\prefect_ELT\Secondary_Roads_Interstates_and_US_Highways.parquet"
-output_file = "D:\CIR\prefect_ELT\Secondary_Roads_Interstates_and_US_Highways_Full.parquet"
+input_file = r"D:\CIR\prefect_ELT\Secondary_Roads_Interstates_and_US_Highways.parquet"
+output_file = r"D:\CIR\prefect_ELT\Secondary_Roads_Interstates_and_US_Highways_Full.parquet"
 
-# Read the Parquet file
-df = pd.read_parquet(input_file)
+# Schema changes, applied in this order: drop → rename → cast → add.
+# cast/add use the names after renaming.
+OPERATIONS = {
+    "drop": [],                        # e.g. ["MTFCC"]
+    "rename": {"NAME": "fullname"},    # old → new
+    "cast": {},                        # e.g. {"STATEFP": "int32"}; any pyarrow type alias
+    "add": {},                         # e.g. {"source": "TIGER2024"} or {"year": {"value": 2024, "type": "int16"}}
+}
 
-# Rename the column
-df = df.rename(columns={"NAME": "fullname"})
 
-# Save back to a Parquet file
-df.to_parquet(output_file, index=False)
+def parse_type(alias: str) -> pa.DataType:
+    """'int32', 'string', 'timestamp[ms]', ... → pyarrow type."""
+    try:
+        return pa.type_for_alias(alias)
+    except ValueError:
+        raise ValueError(f"❌ Unknown type '{alias}'") from None
 
-print(f"✅ Column renamed and saved to {output_file}")
+
+def plan_schema(schema: pa.Schema, ops: dict):
+    """Validate the operations against the input schema; return (kept input columns, output names)."""
+    drop, rename, cast, add = ops.get("drop", []), ops.get("rename", {}), ops.get("cast", {}), ops.get("add", {})
+    missing = [c for c in list(drop) + list(rename) if c not in schema.names]
+    if missing:
+        raise ValueError(f"❌ Columns {missing} not found. Available: {schema.names}")
+    kept = [c for c in schema.names if c not in drop]
+    names = [rename.get(c, c) for c in kept]
+    for col in cast:
+        if col not in names:
+            raise ValueError(f"❌ Cast column '{col}' not in the output columns: {names}")
+    clashes = {n for n in names if names.count(n) > 1} | (set(add) & set(names))
+    if clashes:
+        raise ValueError(f"❌ Duplicate output columns: {sorted(clashes)}")
+    return kept, names
+
+
+def evolve_geo_metadata(metadata: dict, ops: dict, kept: list) -> dict:
+    """Carry the GeoParquet block over: follow renamed geometry/covering columns, forget a
+    covering whose bbox column is dropped, refuse to break the rest."""
+    metadata = dict(metadata or {})
+    metadata.pop(b"pandas", None)  # pandas' column list would be stale after renames/drops
+    if b"geo" not in metadata:
+        return metadata
+    geo = json.loads(metadata[b"geo"])
+    rename = ops.get("rename", {})
+    columns = {}
+    for col, meta in geo.get("columns", {}).items():
+        if col not in kept:
+            if col == geo.get("primary_column"):
+                raise ValueError(f"❌ Cannot drop the primary geometry column '{col}'")
+            continue
+        if col in ops.get("cast", {}) or rename.get(col, col) in ops.get("cast", {}):
+            raise ValueError(f"❌ Cannot cast geometry column '{col}'")
+        bbox = meta.get("covering", {}).get("bbox", {})
+        if any(path[0] not in kept for path in bbox.values()):
+            meta.pop("covering")  # its bbox column is dropped; readers must not look for it
+        for key, path in bbox.items():
+            path[0] = rename.get(path[0], path[0])
+        columns[rename.get(col, col)] = meta
+    geo["columns"] = columns
+    geo["primary_column"] = rename.get(geo["primary_column"], geo["primary_column"])
+    metadata[b"geo"] = json.dumps(geo).encode("utf-8")
+    return metadata
+
+
+def constant_column(spec, num_rows: int) -> pa.Array:
+    if isinstance(spec, dict):
+        scalar = pa.scalar(spec["value"], parse_type(spec["type"]) if "type" in spec else None)
+    else:
+        scalar = pa.scalar(spec)
+    return pa.repeat(scalar, num_rows)
+
+
+def evolve(input_file: str = input_file, output_file: str = output_file, ops: dict = OPERATIONS):
+    """
+    Apply the operations one row group at a time. Untouched columns are passed
+    through as the same Arrow buffers; only cast and added columns are built.
+    Memory stays at about one row group, and the row-group layout and
+    compression of the input are kept.
+    """
+    t0 = time.time()
+    pf = pq.ParquetFile(input_file)
+    schema = pf.schema_arrow
+    kept, names = plan_schema(schema, ops)
+    casts = {col: parse_type(alias) for col, alias in ops.get("cast", {}).items()}
+    add = ops.get("add", {})
+
+    fields = [schema.field(c).with_name(n) for c, n in zip(kept, names)]
+    fields = [f.with_type(casts[f.name]) if f.name in casts else f for f in fields]
+    fields += [pa.field(col, constant_column(spec, 0).type) for col, spec in add.items()]
+    out_schema = pa.schema(fields, metadata=evolve_geo_metadata(schema.metadata, ops, kept))
+
+    compression = "snappy"
+    if pf.metadata.num_row_groups and pf.metadata.num_columns:
+        compression = pf.metadata.row_group(0).column(0).compression.lower()
+        compression = None if compression == "uncompressed" else compression
+
+    rows = 0
+    with pq.ParquetWriter(output_file, out_schema, compression=compression) as writer:
+        for i in range(pf.metadata.num_row_groups):
+            table = pf.read_row_group(i, columns=kept)
+            arrays = [table.column(c) for c in kept]
+            arrays = [a.cast(casts[n]) if n in casts else a for a, n in zip(arrays, names)]
+            arrays += [constant_column(spec, table.num_rows) for spec in add.values()]
+            out = pa.Table.from_arrays(arrays, schema=out_schema)
+            writer.write_table(out, row_group_size=max(out.num_rows, 1))
+            rows += out.num_rows
+            print(f"   row group {i + 1}/{pf.metadata.num_row_groups}: {rows} rows")
+
+    print(f"✅ Schema evolved ({describe(ops)}) and saved to {output_file}: {rows} rows in {time.time() - t0:.1f}s")
+
+
+def describe(ops: dict) -> str:
+    parts = [f"drop {c}" for c in ops.get("drop", [])]
+    parts += [f"rename {a}→{b}" for a, b in ops.get("rename", {}).items()]
+    parts += [f"cast {c}:{t}" for c, t in ops.get("cast", {}).items()]
+    parts += [f"add {c}" for c in ops.get("add", {})]
+    return ", ".join(parts) or "no changes"
+
+
+def parse_pairs(items, flag):
+    pairs = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or not key or not value:
+            raise ValueError(f"❌ Bad {flag} '{item}', expected KEY=VALUE")
+        pairs[key.strip()] = value.strip()
+    return pairs
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Rename/cast/drop/add Parquet columns, streaming row group by row group.")
+    ap.add_argument("--input", default=input_file, help="Input (Geo)Parquet file")
+    ap.add_argument("--output", default=output_file, help="Output (Geo)Parquet file")
+    ap.add_argument("--spec", help='JSON file: {"drop": [...], "rename": {...}, "cast": {...}, "add": {...}}')
+    ap.add_argument("--drop", action="append", default=[], metavar="COLUMN")
+    ap.add_argument("--rename", action="append", default=[], metavar="OLD=NEW")
+    ap.add_argument("--cast", action="append", default=[], metavar="COLUMN=TYPE", help="e.g. STATEFP=int32")
+    ap.add_argument("--add", action="append", default=[], metavar="COLUMN=VALUE", help="Constant string column")
+    args = ap.parse_args()
+
+    if args.spec:
+        with open(args.spec, encoding="utf-8") as f:
+            ops = json.load(f)
+    elif args.drop or args.rename or args.cast or args.add:
+        ops = {
+            "drop": args.drop,
+            "rename": parse_pairs(args.rename, "--rename"),
+            "cast": parse_pairs(args.cast, "--cast"),
+            "add": parse_pairs(args.add, "--add"),
+        }
+    else:
+        ops = OPERATIONS
+    evolve(args.input, args.output, ops)
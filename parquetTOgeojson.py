@@ -1,33 +1,198 @@
-import geopandas as gpd
+import json
+import time
+import argparse
 from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS, Transformer
 
 # --- CONFIG ---
 # Set your input GeoParquet path here
 input_file = r"D:\CIR\state_test\Hawaii\Hawaii Island\Hawaii_Island__latest_20250922_171311.parquet"
 # input_file = r"D:\CIR\state_test\Hawaii\MAUI\Hawaii_Maui__latest_20250922_170140.parquet"
 
-# Optional: specify output file (otherwise same name with .geojson)
-output_file = None  
+# Optional: specify output file (otherwise same name with .geojson, or .geojsonl for GeoJSONSeq)
+output_file = None
+
+COLUMNS = None        # property columns to export, e.g. ["NAME", "STATEFP"]; None = all
+BBOX = None           # (minx, miny, maxx, maxy) in the file's CRS; None = everything
+FILTERS = None        # {"column": [values]}, e.g. {"STATEFP": ["15"]}
+FILTER_OR_MAX_VALUES = 32  # up to this many values per column become OR-ed == tests (prunable); more use isin
+BATCH_SIZE = 100_000  # rows encoded at a time
+SEQ_SUFFIXES = (".geojsonl", ".geojsons", ".geojsonseq", ".ndjson")  # written as one feature per line
+
+
+# --- READ ---
+def read_geo_metadata(path):
+    """(geometry column, its GeoParquet column metadata) – ("geometry", {}) for plain Parquet."""
+    metadata = pq.read_schema(path).metadata or {}
+    if b"geo" not in metadata:
+        return "geometry", {}
+    geo = json.loads(metadata[b"geo"])
+    geom_col = geo.get("primary_column", "geometry")
+    return geom_col, geo.get("columns", {}).get(geom_col, {})
+
+
+def build_filter(schema, geom_meta, bbox=None, filters=None):
+    """
+    Attribute filters and, when the file has a bbox covering column, the bbox test
+    as a dataset expression, so row groups that cannot match are never decoded.
+    """
+    expr = None
+    for col, values in (filters or {}).items():
+        if col not in schema.names:
+            raise ValueError(f"Filter column '{col}' not found. Available: {schema.names}")
+        col_type = schema.field(col).type
+        if pa.types.is_dictionary(col_type):
+            col_type = col_type.value_type
+        values = pa.array(list(values)).cast(col_type)
+        if len(values) <= FILTER_OR_MAX_VALUES:
+            # == (OR-ed for a few values) is checked against row-group min/max; isin is not
+            cond = None
+            for v in values:
+                term = ds.field(col) == v
+                cond = term if cond is None else cond | term
+        else:
+            cond = ds.field(col).isin(values)
+        expr = cond if expr is None else expr & cond
+
+    covering = geom_meta.get("covering", {}).get("bbox")
+    if bbox is not None and covering:
+        minx, miny, maxx, maxy = bbox
+        field = {key: ds.field(*path) for key, path in covering.items()}
+        cond = (field["xmin"] <= maxx) & (field["xmax"] >= minx) & (field["ymin"] <= maxy) & (field["ymax"] >= miny)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def lonlat_transformer(crs):
+    """Transformer to lon/lat WGS84 (GeoJSON's only CRS), or None when the data already is."""
+    if crs is None:
+        return None  # GeoParquet default is OGC:CRS84
+    crs = CRS.from_user_input(crs)
+    if crs.to_epsg() == 4326 or crs.equals("OGC:CRS84", ignore_axis_order=True):
+        return None
+    return Transformer.from_crs(crs, 4326, always_xy=True)
+
+
+# --- ENCODE ---
+def encode_features(table, geom_col, transformer=None, bbox=None):
+    """Arrow table → list of GeoJSON Feature strings (properties and geometries encoded in bulk)."""
+    geoms = shapely.from_wkb(table.column(geom_col).to_numpy(zero_copy_only=False))
+    if bbox is not None:
+        keep = shapely.intersects(geoms, shapely.box(*bbox))
+        table, geoms = table.filter(pa.array(keep)), geoms[keep]
+    if transformer is not None:
+        geoms = shapely.transform(geoms, lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])))
+    geometry = shapely.to_geojson(geoms)
+
+    props = table.drop_columns([geom_col])
+    if props.num_columns:
+        # One C-level JSON encode for the whole batch, one object per line (newlines inside strings are escaped)
+        df = props.to_pandas(integer_object_nulls=True)
+        properties = df.to_json(
+            orient="records", lines=True, date_format="iso", force_ascii=False, double_precision=15
+        ).split("\n")[:len(df)]
+    else:
+        properties = ["{}"] * table.num_rows
+
+    return [
+        f'{{"type":"Feature","properties":{p},"geometry":{g if g is not None else "null"}}}'
+        for p, g in zip(properties, geometry)
+    ]
+
 
 # --- CONVERSION FUNCTION ---
-def geoparquet_to_geojson(input_file, output_file=None):
+def geoparquet_to_geojson(
+    input_file,
+    output_file=None,
+    columns=COLUMNS,
+    bbox=BBOX,
+    filters=FILTERS,
+    seq=None,
+    batch_size=BATCH_SIZE,
+):
     """
-    Convert a GeoParquet file to GeoJSON.
+    Stream a GeoParquet file to GeoJSON. Only the requested columns are read,
+    row groups outside the filters/bbox are skipped, and each batch is encoded
+    and written before the next is read. `seq=True` (or a .geojsonl/.geojsons
+    output name) writes GeoJSONSeq, one feature per line; otherwise a
+    FeatureCollection. Returns the number of features written.
     """
     input_path = Path(input_file)
     if not input_path.exists():
         raise FileNotFoundError(f"Input file not found: {input_file}")
-    
+    if seq is None:
+        seq = output_file is not None and Path(output_file).suffix.lower() in SEQ_SUFFIXES
     if output_file is None:
-        output_file = input_path.with_suffix(".geojson")
-    
-    print(f"Reading {input_file}...")
-    gdf = gpd.read_parquet(input_file)
+        output_file = input_path.with_suffix(".geojsonl" if seq else ".geojson")
 
+    geom_col, geom_meta = read_geo_metadata(input_file)
+    if geom_meta.get("encoding", "WKB").upper() != "WKB":
+        raise ValueError(f"Unsupported GeoParquet geometry encoding: {geom_meta['encoding']}")
+    dataset = ds.dataset(input_file, format="parquet")
+    covering = geom_meta.get("covering", {}).get("bbox", {})
+    hidden = {path[0] for path in covering.values()}  # bbox covering column is not a property
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c != geom_col and c not in hidden]
+    missing = [c for c in columns if c not in dataset.schema.names]
+    if missing:
+        raise ValueError(f"Columns {missing} not found. Available: {dataset.schema.names}")
+    expr = build_filter(dataset.schema, geom_meta, bbox, filters)
+    transformer = lonlat_transformer(geom_meta.get("crs"))
+
+    print(f"Reading {input_file}...")
     print(f"Writing to {output_file}...")
-    gdf.to_file(output_file, driver="GeoJSON")
+    t0 = time.time()
+    rows = 0
+    with open(output_file, "w", encoding="utf-8", newline="\n", buffering=1 << 20) as out:
+        if not seq:
+            out.write('{"type":"FeatureCollection","features":[\n')
+        for batch in dataset.to_batches(columns=list(columns) + [geom_col], filter=expr, batch_size=batch_size):
+            features = encode_features(pa.Table.from_batches([batch]), geom_col, transformer, bbox)
+            if not features:
+                continue
+            if seq:
+                out.write("\n".join(features) + "\n")
+            else:
+                out.write((",\n" if rows else "") + ",\n".join(features))
+            rows += len(features)
+            print(f"   {rows} features ({rows / (time.time() - t0):,.0f}/s)")
+        if not seq:
+            out.write("\n]}\n")
+
+    print(f"✅ Conversion completed! {rows} features in {time.time() - t0:.1f}s")
+    return rows
+
+
+def parse_filters(items):
+    """["STATEFP=15,06"] → {"STATEFP": ["15", "06"]}"""
+    filters = {}
+    for item in items:
+        col, sep, values = item.partition("=")
+        if not sep or not col or not values:
+            raise ValueError(f"Bad --filter '{item}', expected COLUMN=VALUE[,VALUE...]")
+        filters.setdefault(col.strip(), []).extend(v.strip() for v in values.split(","))
+    return filters or None
 
-    print("✅ Conversion completed!")
 
 # --- RUN ---
-geoparquet_to_geojson(input_file, output_file)
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stream GeoParquet to GeoJSON / GeoJSONSeq.")
+    ap.add_argument("--input", default=input_file, help="Input GeoParquet file")
+    ap.add_argument("--output", default=output_file, help="Output file (default: input name with .geojson)")
+    ap.add_argument("--columns", nargs="+", default=COLUMNS, help="Property columns to export (default: all)")
+    ap.add_argument("--bbox", nargs=4, type=float, default=BBOX, metavar=("MINX", "MINY", "MAXX", "MAXY"),
+                    help="Only features intersecting this box (file CRS)")
+    ap.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE[,VALUE...]",
+                    help="Only matching rows, e.g. --filter STATEFP=15")
+    ap.add_argument("--seq", action="store_true", default=None, help="Write GeoJSONSeq (one feature per line)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows encoded at a time")
+    args = ap.parse_args()
+    geoparquet_to_geojson(
+        args.input, args.output, args.columns, args.bbox,
+        parse_filters(args.filter) or FILTERS, args.seq, args.batch_size,
+    )
@@ -1,9 +1,17 @@
 import os
+import re
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pyarrow as pa
 import pyarrow.dataset as ds
 import geopandas as gpd
-from shapely import wkb, wkt
-from shapely.geometry import MultiLineString, LineString
-from sqlalchemy import create_engine
+import shapely
+from sqlalchemy import create_engine, text
 from geoalchemy2 import Geometry
 import dotenv
 
@@ -17,6 +25,22 @@ TABLE_NAME = "us_roads"
 CHUNK_SIZE = 50_000   # adjust based on RAM
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Only keep required columns
+COLUMNS = ["FULLNAME", "geometry", "PRETYPEABRV"]
+GEOMETRY_COLUMN = "geometry"
+
+# Partitioned parallel upload (--workers N): rows are split on disk by state FIPS
+# (when STATE_COLUMN exists) or a lon/lat tile, and each partition is loaded by
+# its own worker process over its own connection.
+SCHEMA = "public"
+WORKERS = 0                    # 0 = single-connection batch upload above
+PARTITION_BY = "auto"          # "state", "tile" or "auto" (state if the column exists)
+STATE_COLUMN = "STATEFP"
+TILE_DEGREES = 2.0             # tile size when partitioning by tile
+PARTITION_KEY = "part_key"     # column holding the partition key in PostGIS
+UNKNOWN_KEY = "unknown"        # partition for rows without a state / geometry
+PG_PARTITIONED = True          # LIST-partition us_roads on part_key (one child table per partition)
+
 if not DATABASE_URL:
     raise ValueError("❌ DATABASE_URL not set in .env")
 
@@ -25,59 +49,300 @@ if not DATABASE_URL:
 # ======================
 engine = create_engine(DATABASE_URL)
 
+
 # ======================
-# READ DATASET IN CHUNKS
+# GEOMETRY
 # ======================
-dataset = ds.dataset(INPUT_FILE, format="parquet")
+def detect_geometry_encoding(dataset: ds.Dataset) -> str:
+    """'wkb' or 'wkt', from GeoParquet metadata if present, else from the Arrow column type."""
+    metadata = dataset.schema.metadata or {}
+    if b"geo" in metadata:
+        column_meta = json.loads(metadata[b"geo"]).get("columns", {}).get(GEOMETRY_COLUMN, {})
+        encoding = column_meta.get("encoding", "WKB").lower()
+        if encoding in ("wkb", "wkt"):
+            return encoding
+        raise ValueError(f"❌ Unsupported GeoParquet geometry encoding: {column_meta['encoding']}")
+
+    geom_type = dataset.schema.field(GEOMETRY_COLUMN).type
+    if pa.types.is_binary(geom_type) or pa.types.is_large_binary(geom_type):
+        return "wkb"
+    if pa.types.is_string(geom_type) or pa.types.is_large_string(geom_type):
+        return "wkt"
+    raise ValueError(f"❌ Cannot tell geometry encoding from column type {geom_type}")
 
-# Only keep required columns
-columns = ["FULLNAME", "geometry", "PRETYPEABRV"]
-
-print("Starting upload...")
-
-batch_num = 0
-for batch in dataset.to_batches(columns=columns, batch_size=CHUNK_SIZE):
-    batch_num += 1
-    print(f"Processing batch {batch_num}...")
-
-    # Convert Arrow batch → pandas DataFrame
-    df = batch.to_pandas()
-
-    # Try to interpret geometry
-    if df["geometry"].dtype == object:  
-        try:
-            # Try WKB
-            geom_series = df["geometry"].apply(lambda g: wkb.loads(g) if g is not None else None)
-        except Exception:
-            # If WKT fallback
-            geom_series = df["geometry"].apply(lambda g: wkt.loads(g) if g is not None else None)
-    else:
-        # Already geometry
-        geom_series = df["geometry"]
 
-    # Build GeoDataFrame
-    gdf = gpd.GeoDataFrame(df, geometry=geom_series)
+def decode_geometry(values: pa.Array, encoding: str) -> np.ndarray:
+    """Vectorized WKB/WKT → Shapely array (nulls stay None)."""
+    values = values.to_numpy(zero_copy_only=False)
+    return shapely.from_wkb(values) if encoding == "wkb" else shapely.from_wkt(values)
 
-    # Set CRS if missing
-    if gdf.crs is None:
-        gdf.set_crs("EPSG:4326", inplace=True)
 
-    # Ensure all are MULTILINESTRING
-    gdf["geometry"] = gdf["geometry"].apply(
-        lambda g: g if g is None or g.geom_type == "MultiLineString" 
-        else MultiLineString([g]) if isinstance(g, LineString) 
-        else g
+def promote_to_multilinestring(geoms: np.ndarray) -> np.ndarray:
+    """LineString → single-part MultiLineString with array ops; everything else untouched."""
+    lines = shapely.get_type_id(geoms) == 1  # LineString
+    if lines.any():
+        geoms = geoms.copy()
+        geoms[lines] = shapely.multilinestrings(geoms[lines], indices=np.arange(lines.sum()))
+    return geoms
+
+
+def batch_to_geodataframe(batch: pa.RecordBatch, encoding: str) -> gpd.GeoDataFrame:
+    geoms = promote_to_multilinestring(decode_geometry(batch.column(GEOMETRY_COLUMN), encoding))
+    attrs = batch.drop_columns([GEOMETRY_COLUMN]).to_pandas()
+    return gpd.GeoDataFrame(attrs, geometry=geoms, crs="EPSG:4326")
+
+
+# ======================
+# UPLOAD TO POSTGIS
+# ======================
+def upload_roads(input_file: str = INPUT_FILE, chunk_size: int = CHUNK_SIZE):
+    dataset = ds.dataset(input_file, format="parquet")
+    encoding = detect_geometry_encoding(dataset)
+    print(f"Starting upload... (geometry encoding: {encoding.upper()})")
+
+    total_rows, decode_s = 0, 0.0
+    t0 = time.time()
+    for batch_num, batch in enumerate(dataset.to_batches(columns=COLUMNS, batch_size=chunk_size), start=1):
+        print(f"Processing batch {batch_num}...")
+        t_decode = time.time()
+        gdf = batch_to_geodataframe(batch, encoding)
+        decode_s += time.time() - t_decode
+
+        gdf.to_postgis(
+            TABLE_NAME,
+            engine,
+            if_exists="append",   # append chunks
+            index=False,
+            dtype={"geometry": Geometry("MULTILINESTRING", srid=4326)}
+        )
+        total_rows += len(gdf)
+        elapsed = time.time() - t0
+        print(f"   {total_rows} rows ({total_rows / elapsed:,.0f} rows/s overall, "
+              f"geometry decode {total_rows / max(decode_s, 1e-9):,.0f} rows/s)")
+
+    print(f"✅ Upload completed successfully! {total_rows} rows in {time.time() - t0:.1f}s")
+
+
+# ======================
+# PARTITIONED PARALLEL UPLOAD
+# ======================
+def partition_keys(batch: pa.RecordBatch, mode: str, encoding: str) -> pa.Array:
+    """
+    State FIPS, or the lon/lat tile of each road's bounding-box center. A null
+    state or geometry maps to UNKNOWN_KEY, never to the hive null directory.
+    """
+    if mode == "state":
+        return batch.column(STATE_COLUMN).cast(pa.string()).fill_null(UNKNOWN_KEY)
+    bounds = shapely.bounds(decode_geometry(batch.column(GEOMETRY_COLUMN), encoding))
+    unknown = np.isnan(bounds[:, 0])  # null or empty geometry
+    tx = np.nan_to_num(np.floor((bounds[:, 0] + bounds[:, 2]) / 2 / TILE_DEGREES)).astype(int)
+    ty = np.nan_to_num(np.floor((bounds[:, 1] + bounds[:, 3]) / 2 / TILE_DEGREES)).astype(int)
+    keys = np.char.add(np.char.add(tx.astype(str), "_"), ty.astype(str)).astype(object)
+    keys[unknown] = UNKNOWN_KEY
+    return pa.array(keys, pa.string())
+
+
+def write_partitions(dataset: ds.Dataset, work_dir: str, mode: str, encoding: str, chunk_size: int):
+    """One streaming pass that splits the roads into hive partitions on disk."""
+    read_columns = COLUMNS + ([STATE_COLUMN] if mode == "state" and STATE_COLUMN not in COLUMNS else [])
+    fields = [dataset.schema.field(c) for c in COLUMNS] + [pa.field(PARTITION_KEY, pa.string())]
+    schema = pa.schema(fields)
+
+    def batches():
+        for batch in dataset.to_batches(columns=read_columns, batch_size=chunk_size):
+            arrays = [batch.column(c) for c in COLUMNS] + [partition_keys(batch, mode, encoding)]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    ds.write_dataset(
+        batches(), work_dir, schema=schema, format="parquet",
+        partitioning=ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive"),
+        existing_data_behavior="overwrite_or_ignore",
     )
 
-    # ======================
-    # UPLOAD TO POSTGIS
-    # ======================
-    gdf.to_postgis(
+
+def partition_table_name(key: str) -> str:
+    return f"{TABLE_NAME}_p_{re.sub(r'[^0-9A-Za-z]', '_', key.lower())}"
+
+
+def loading_table_name(key: str) -> str:
+    return f"{partition_table_name(key)}__new"  # loaded and indexed here, then swapped in for the live child
+
+
+def partition_literal(key: str) -> str:
+    return "'" + key.replace("'", "''") + "'"  # DDL takes no bind parameters
+
+
+def _pg_type(arrow_type: pa.DataType) -> str:
+    if pa.types.is_integer(arrow_type):
+        return "bigint"
+    if pa.types.is_floating(arrow_type):
+        return "double precision"
+    return "text"
+
+
+def prepare_partitioned_table(schema: pa.Schema):
+    """
+    Create us_roads as a LIST-partitioned table (if missing). Existing partitions
+    stay live until upload_partition swaps in their reloaded replacement.
+    """
+    parent = f'"{SCHEMA}"."{TABLE_NAME}"'
+    cols = [f'"{c}" {_pg_type(schema.field(c).type)}' for c in COLUMNS if c != GEOMETRY_COLUMN]
+    cols += [f'"{PARTITION_KEY}" text NOT NULL', f'"{GEOMETRY_COLUMN}" geometry(MULTILINESTRING, 4326)']
+    with engine.begin() as conn:
+        kind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"),
+                            {"t": f"{SCHEMA}.{TABLE_NAME}"}).scalar()
+        if kind is None:
+            conn.execute(text(f"CREATE TABLE {parent} ({', '.join(cols)}) PARTITION BY LIST (\"{PARTITION_KEY}\")"))
+        elif kind != "p":
+            raise ValueError(f"❌ {SCHEMA}.{TABLE_NAME} exists but is not partitioned; drop it or set PG_PARTITIONED = False")
+
+
+def prepare_plain_table(dataset: ds.Dataset, encoding: str):
+    """Create us_roads (if missing) before the workers start appending to it."""
+    first = next(dataset.to_batches(columns=COLUMNS, batch_size=1))
+    batch_to_geodataframe(first, encoding).iloc[:0].to_postgis(
         TABLE_NAME,
         engine,
-        if_exists="append",   # append chunks
+        schema=SCHEMA,
+        if_exists="append",
         index=False,
         dtype={"geometry": Geometry("MULTILINESTRING", srid=4326)}
     )
 
-print("✅ Upload completed successfully!")
+
+def _init_worker():
+    engine.dispose(close=False)  # forked workers must not reuse the parent's pooled connections
+
+
+def load_partition(partition_dir: str, key: str, encoding: str, target: str, pg_partitioned: bool,
+                   chunk_size: int) -> int:
+    """Append one partition's rows to `target`; returns the row count."""
+    rows = 0
+    for batch in ds.dataset(partition_dir, format="parquet").to_batches(columns=COLUMNS, batch_size=chunk_size):
+        gdf = batch_to_geodataframe(batch, encoding)
+        if pg_partitioned:
+            gdf[PARTITION_KEY] = key
+        gdf.to_postgis(
+            target,
+            engine,
+            schema=SCHEMA,
+            if_exists="append",
+            index=False,
+            dtype={"geometry": Geometry("MULTILINESTRING", srid=4326)}
+        )
+        rows += len(gdf)
+    return rows
+
+
+def upload_partition(partition_dir: str, key: str, encoding: str, pg_partitioned: bool, chunk_size: int):
+    """
+    Worker task: load one partition over this process's own connection. A child
+    is loaded into a fresh, detached table, indexed and analyzed, then swapped
+    for the live child in one transaction, so a failed load leaves the old
+    partition in place. Its GiST index is adopted by the parent's index instead
+    of a second one being built.
+    """
+    t0 = time.time()
+    if not pg_partitioned:
+        return key, load_partition(partition_dir, key, encoding, TABLE_NAME, False, chunk_size), time.time() - t0
+
+    parent = f'"{SCHEMA}"."{TABLE_NAME}"'
+    child, loading = partition_table_name(key), loading_table_name(key)
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{SCHEMA}"."{loading}"'))  # left over from a killed run
+        # The CHECK matches the partition bound, so ATTACH PARTITION skips its validation scan
+        conn.execute(text(f'CREATE TABLE "{SCHEMA}"."{loading}" (LIKE {parent} INCLUDING DEFAULTS, '
+                          f'CHECK ("{PARTITION_KEY}" = {partition_literal(key)}))'))
+    try:
+        rows = load_partition(partition_dir, key, encoding, loading, True, chunk_size)
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE INDEX "idx_{loading}_{GEOMETRY_COLUMN}" ON "{SCHEMA}"."{loading}" '
+                              f'USING GIST ("{GEOMETRY_COLUMN}")'))
+            conn.execute(text(f'ANALYZE "{SCHEMA}"."{loading}"'))
+        with engine.begin() as conn:
+            attached = conn.execute(text("SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:c)"),
+                                    {"c": f"{SCHEMA}.{child}"}).scalar()
+            if attached:
+                conn.execute(text(f'ALTER TABLE {parent} DETACH PARTITION "{SCHEMA}"."{child}"'))
+            conn.execute(text(f'DROP TABLE IF EXISTS "{SCHEMA}"."{child}"'))
+            conn.execute(text(f'ALTER TABLE {parent} ATTACH PARTITION "{SCHEMA}"."{loading}" '
+                              f'FOR VALUES IN ({partition_literal(key)})'))
+            conn.execute(text(f'ALTER TABLE "{SCHEMA}"."{loading}" RENAME TO "{child}"'))
+            conn.execute(text(f'ALTER INDEX "{SCHEMA}"."idx_{loading}_{GEOMETRY_COLUMN}" '
+                              f'RENAME TO "idx_{child}_{GEOMETRY_COLUMN}"'))
+    except BaseException:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE IF EXISTS "{SCHEMA}"."{loading}"'))
+        raise
+    return key, rows, time.time() - t0
+
+
+def parallel_upload_roads(
+    input_file: str = INPUT_FILE,
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = 4,
+    partition_by: str = PARTITION_BY,
+    pg_partitioned: bool = PG_PARTITIONED,
+):
+    dataset = ds.dataset(input_file, format="parquet")
+    encoding = detect_geometry_encoding(dataset)
+    mode = partition_by
+    if mode == "auto":
+        mode = "state" if STATE_COLUMN in dataset.schema.names else "tile"
+    if mode == "state" and STATE_COLUMN not in dataset.schema.names:
+        raise ValueError(f"❌ '{STATE_COLUMN}' not found; use --partition-by tile")
+
+    t0 = time.time()
+    work_dir = tempfile.mkdtemp(prefix="roads_upload_", dir=os.path.dirname(os.path.abspath(input_file)))
+    try:
+        write_partitions(dataset, work_dir, mode, encoding, chunk_size)
+        partitions = {d.split("=", 1)[1]: os.path.join(work_dir, d) for d in os.listdir(work_dir)}
+        # Biggest partitions first so the pool is not left waiting on one large state
+        keys = sorted(partitions, key=lambda k: sum(e.stat().st_size for e in os.scandir(partitions[k])), reverse=True)
+        print(f"Starting upload... {len(keys)} {mode} partitions, {workers} workers "
+              f"({'LIST-partitioned' if pg_partitioned else 'single'} table, geometry {encoding.upper()})")
+
+        if pg_partitioned:
+            prepare_partitioned_table(dataset.schema)
+        else:
+            prepare_plain_table(dataset, encoding)
+
+        total_rows = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(upload_partition, partitions[k], k, encoding, pg_partitioned, chunk_size) for k in keys]
+            for done, future in enumerate(as_completed(futures), start=1):
+                key, rows, seconds = future.result()
+                total_rows += rows
+                print(f"   [{done}/{len(keys)}] {PARTITION_KEY}={key}: {rows} rows in {seconds:.1f}s "
+                      f"({total_rows / (time.time() - t0):,.0f} rows/s overall)")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Parent index: PostgreSQL attaches the per-partition GiST indexes instead of rebuilding them
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS "idx_{TABLE_NAME}_{GEOMETRY_COLUMN}" '
+                          f'ON "{SCHEMA}"."{TABLE_NAME}" USING GIST ("{GEOMETRY_COLUMN}")'))
+        conn.execute(text(f'ANALYZE "{SCHEMA}"."{TABLE_NAME}"'))
+    print(f"✅ Upload completed successfully! {total_rows} rows in {time.time() - t0:.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=f"Upload roads GeoParquet → PostGIS ({TABLE_NAME}).")
+    ap.add_argument("--input", default=INPUT_FILE, help="Input roads GeoParquet")
+    ap.add_argument("--workers", type=int, default=WORKERS,
+                    help="Load state/tile partitions from N processes (0 = single-connection upload)")
+    ap.add_argument("--partition-by", choices=["auto", "state", "tile"], default=PARTITION_BY,
+                    help="Partition key for --workers: state FIPS or a lon/lat tile")
+    ap.add_argument("--no-pg-partitions", action="store_true",
+                    help="Load into a plain table instead of a LIST-partitioned one")
+    args = ap.parse_args()
+
+    if args.workers > 0:
+        parallel_upload_roads(args.input, CHUNK_SIZE, args.workers, args.partition_by,
+                              PG_PARTITIONED and not args.no_pg_partitions)
+    else:
+        upload_roads(args.input)
+
+
+if __name__ == "__main__":
+    main()
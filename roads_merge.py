@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import shapely
+
+# ======================
+# CONFIG
+# ======================
+INPUT_FILE = r"D:\CIR\prefect_ELT\merged_roads.parquet"
+OUTPUT_FILE = r"D:\CIR\prefect_ELT\merged_roads_linemerged.parquet"
+SEGMENTS_FILE = r"D:\CIR\prefect_ELT\merged_roads_segments.parquet"  # (road_id, segment id) side table
+BATCH_SIZE = 250_000
+WORKERS = os.cpu_count() or 4
+
+NAME_COLUMN = "FULLNAME"
+TYPE_COLUMN = "PRETYPEABRV"
+GEOMETRY_COLUMN = "geometry"
+SEGMENT_ID_COLUMN = "LINEARID"              # row number is used when the file has no such column
+COUNTY_COLUMNS = ["STATEFP", "COUNTYFP"]    # partition by county when present ...
+NAME_BUCKETS = 64                           # ... otherwise by a hash of the street name
+PARTITION_COLUMN = "_partition"
+NULL_PARTITION = "null"                     # segments without geometry; never merged
+
+
+# ======================
+# PARTITION ON DISK
+# ======================
+def partition_keys(batch: pa.RecordBatch, by_county: bool, offset: int) -> pa.Array:
+    """
+    County FIPS, or a bucket of the normalized street name, so every segment of a
+    name lands in the same partition whatever its location (no tile edges to
+    split a street). Unnamed segments are spread round-robin; null geometries get
+    their own partition.
+    """
+    if by_county:
+        keys = pc.binary_join_element_wise(*[batch.column(c).cast(pa.string()) for c in COUNTY_COLUMNS], "")
+    else:
+        encoded = normalize_names(batch.column(NAME_COLUMN).cast(pa.string())).dictionary_encode()
+        # crc32, not hash(): the bucket of a name must not change between batches or runs
+        name_buckets = np.array([zlib.crc32(s.encode("utf-8")) % NAME_BUCKETS
+                                 for s in encoded.dictionary.to_pylist()], dtype=np.int64)
+        named = encoded.indices.is_valid().to_numpy(zero_copy_only=False)
+        buckets = np.arange(offset, offset + batch.num_rows) % NAME_BUCKETS
+        buckets[named] = name_buckets[encoded.indices.drop_null().to_numpy()]
+        keys = pa.array(buckets.astype(str), pa.string())
+    return pc.if_else(batch.column(GEOMETRY_COLUMN).is_null(), NULL_PARTITION, keys)
+
+
+def write_partitions(input_file: str, work_dir: str, batch_size: int):
+    """Stream the input once into hive partitions (one directory per county/name bucket)."""
+    dataset = ds.dataset(input_file, format="parquet")
+    names = dataset.schema.names
+    by_county = all(c in names for c in COUNTY_COLUMNS)
+    has_segment_ids = SEGMENT_ID_COLUMN in names
+    columns = [c for c in [NAME_COLUMN, TYPE_COLUMN, GEOMETRY_COLUMN, SEGMENT_ID_COLUMN] + COUNTY_COLUMNS if c in names]
+
+    fields = [dataset.schema.field(c) for c in columns]
+    if not has_segment_ids:
+        fields.append(pa.field(SEGMENT_ID_COLUMN, pa.int64()))
+    schema = pa.schema(fields + [pa.field(PARTITION_COLUMN, pa.string())])
+
+    def batches():
+        offset = 0
+        for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+            arrays = list(batch.columns)
+            if not has_segment_ids:
+                arrays.append(pa.array(np.arange(offset, offset + batch.num_rows, dtype=np.int64)))
+            arrays.append(partition_keys(batch, by_county, offset))
+            offset += batch.num_rows
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    ds.write_dataset(
+        batches(), work_dir, schema=schema, format="parquet",
+        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive"),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    print(f"🗂️ Partitioned by {'county' if by_county else f'street name ({NAME_BUCKETS} buckets)'} into {work_dir}")
+
+
+# ======================
+# MERGE ONE PARTITION
+# ======================
+def normalize_names(names: pa.Array) -> pa.Array:
+    """Upper-case, trimmed, single-spaced street names; blank → null."""
+    names = pc.utf8_upper(pc.utf8_trim_whitespace(pc.replace_substring_regex(names, r"\s+", " ")))
+    return pc.if_else(pc.equal(names, ""), pa.scalar(None, pa.string()), names)
+
+
+def connected_components(geoms: np.ndarray, group: np.ndarray) -> np.ndarray:
+    """
+    Label each segment with the lowest index of the same-group segments it is
+    connected to (touching, directly or through others), so two streets that
+    share a name but never meet stay apart. Missing/empty geometries are alone.
+    """
+    label = np.arange(len(geoms))
+    valid = np.flatnonzero(~shapely.is_missing(geoms) & ~shapely.is_empty(geoms))
+    left, right = shapely.STRtree(geoms[valid]).query(geoms[valid], predicate="intersects")
+    left, right = valid[left], valid[right]
+    same = group[left] == group[right]
+    left, right = left[same], right[same]
+    while True:  # min-label propagation over the touching pairs, with pointer jumping
+        updated = label.copy()
+        np.minimum.at(updated, left, label[right])
+        updated = updated[updated]
+        if np.array_equal(updated, label):
+            return label
+        label = updated
+
+
+def merge_partition(partition_dir: str):
+    """
+    Worker task: group a partition's segments by normalized name + street type,
+    split each group into its connected pieces and line-merge every piece in one
+    vectorized pass. Unnamed segments and null geometries stay on their own.
+    Returns (roads table with local ids, (local id, segment id) table).
+    """
+    table = ds.dataset(partition_dir, format="parquet").to_table()
+    key = partition_dir.rstrip("/\\").rsplit(f"{PARTITION_COLUMN}=", 1)[-1]
+    n = table.num_rows
+
+    names = normalize_names(table.column(NAME_COLUMN).combine_chunks().cast(pa.string()))
+    kinds = table.column(TYPE_COLUMN).combine_chunks().cast(pa.string()) if TYPE_COLUMN in table.column_names \
+        else pa.nulls(n, pa.string())
+    group_key = pc.binary_join_element_wise(names, pc.fill_null(kinds, ""), "\x1f")  # null name → null key
+    encoded = group_key.dictionary_encode()
+    group = pc.fill_null(encoded.indices, -1).to_numpy().astype(np.int64)
+    unnamed = np.flatnonzero(group < 0)
+    group[unnamed] = len(encoded.dictionary) + np.arange(len(unnamed))
+
+    # One road per connected piece of a group; its lowest segment supplies the attributes
+    geoms = shapely.from_wkb(table.column(GEOMETRY_COLUMN).to_numpy(zero_copy_only=False))
+    first, group = np.unique(connected_components(geoms, group), return_inverse=True)
+    n_groups = len(first)
+
+    # All segments of a road → one MultiLineString → line_merge, all as array ops
+    parts, owner = shapely.get_parts(geoms, return_index=True)
+    keep = ~shapely.is_empty(parts)
+    parts, owner = parts[keep], owner[keep]
+    order = np.argsort(group[owner], kind="stable")  # multilinestrings() wants sorted indices
+    # Pre-sized output: groups whose segments all have null/empty geometry stay None
+    merged = np.full(n_groups, None, dtype=object)
+    shapely.multilinestrings(parts[order], indices=group[owner][order], out=merged)
+    merged = shapely.line_merge(merged)
+    single = shapely.get_type_id(merged) == 1
+    merged[single] = shapely.multilinestrings(merged[single], indices=np.arange(single.sum()))
+
+    counts = np.bincount(group, minlength=n_groups)
+    roads = pa.table({
+        "road_id": pa.array(np.arange(n_groups, dtype=np.int64)),
+        NAME_COLUMN: table.column(NAME_COLUMN).take(pa.array(first)),
+        TYPE_COLUMN: kinds.take(pa.array(first)),
+        PARTITION_COLUMN: pa.array([key] * n_groups, pa.string()),
+        "segment_count": pa.array(counts.astype(np.int32)),
+        GEOMETRY_COLUMN: pa.array(shapely.to_wkb(merged), pa.binary()),
+    })
+    segments = pa.table({"road_id": pa.array(group), SEGMENT_ID_COLUMN: table.column(SEGMENT_ID_COLUMN)})
+    return roads, segments
+
+
+# ======================
+# RUN
+# ======================
+def geo_metadata(input_file: str) -> dict:
+    """GeoParquet metadata for the merged output, keeping the input CRS if it declares one."""
+    column_meta = {"encoding": "WKB", "geometry_types": ["MultiLineString"]}
+    metadata = pq.read_schema(input_file).metadata or {}
+    if b"geo" in metadata:
+        crs = json.loads(metadata[b"geo"]).get("columns", {}).get(GEOMETRY_COLUMN, {}).get("crs")
+        if crs is not None:
+            column_meta["crs"] = crs
+    geo = {"version": "1.0.0", "primary_column": GEOMETRY_COLUMN, "columns": {GEOMETRY_COLUMN: column_meta}}
+    return {b"geo": json.dumps(geo).encode("utf-8")}
+
+
+def merge_roads(
+    input_file: str = INPUT_FILE,
+    output_file: str = OUTPUT_FILE,
+    segments_file: str = SEGMENTS_FILE,
+    workers: int = WORKERS,
+    batch_size: int = BATCH_SIZE,
+):
+    t0 = time.time()
+    work_dir = tempfile.mkdtemp(prefix="roads_partitions_", dir=os.path.dirname(os.path.abspath(output_file)))
+    roads_writer = segments_writer = None
+    try:
+        write_partitions(input_file, work_dir, batch_size)
+        partitions = [os.path.join(work_dir, d) for d in os.listdir(work_dir)]
+        # Biggest partitions first so one large county does not finish last on its own
+        partitions.sort(key=lambda p: sum(e.stat().st_size for e in os.scandir(p)), reverse=True)
+        print(f"🔀 Line-merging {len(partitions)} partitions with {workers} workers...")
+
+        next_id = segments_in = roads_out = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(merge_partition, p) for p in partitions]
+            for done, future in enumerate(as_completed(futures), start=1):
+                roads, segments = future.result()
+                # Local ids → file-wide ids
+                roads = roads.set_column(0, "road_id", pc.add(roads["road_id"], next_id))
+                segments = segments.set_column(0, "road_id", pc.add(segments["road_id"], next_id))
+                next_id += roads.num_rows
+                if roads_writer is None:
+                    roads_writer = pq.ParquetWriter(output_file, roads.schema.with_metadata(geo_metadata(input_file)))
+                    segments_writer = pq.ParquetWriter(segments_file, segments.schema)
+                roads_writer.write_table(roads)
+                segments_writer.write_table(segments)
+                segments_in += segments.num_rows
+                roads_out += roads.num_rows
+                print(f"   {done}/{len(partitions)} partitions: {segments_in} segments → {roads_out} roads")
+    finally:
+        if roads_writer is not None:
+            roads_writer.close()
+            segments_writer.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"✅ {segments_in} segments → {roads_out} roads ({segments_in / max(roads_out, 1):.1f}x fewer) "
+          f"in {time.time() - t0:.1f}s")
+    print(f"   roads: {output_file}\n   segment ids: {segments_file}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Line-merge road segments by name within county/street-name partitions.")
+    ap.add_argument("--input", default=INPUT_FILE, help="Input roads GeoParquet")
+    ap.add_argument("--output", default=OUTPUT_FILE, help="Merged roads GeoParquet")
+    ap.add_argument("--segments", default=SEGMENTS_FILE, help="(road_id, segment id) side table")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="Worker processes")
+    args = ap.parse_args()
+    merge_roads(args.input, args.output, args.segments, args.workers)
+
+
+if __name__ == "__main__":
+    main()